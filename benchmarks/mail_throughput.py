@@ -0,0 +1,45 @@
+"""Messages per second through MailQueue against the local SMTP stand-in, pooled vs. one connection per message.
+
+    python benchmarks/mail_throughput.py [messages]
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "tests")]
+
+import bot  # noqa: E402
+from smtp_standin import SMTPStandIn  # noqa: E402
+
+
+class ConnectPerMessage(bot.MailQueue):
+    def _send(self, smtp, message):
+        smtp = self._connect()
+        smtp.send_message(message)
+        smtp.quit()
+        return None
+
+
+def run(mail, standin, messages):
+    connections = standin.connections
+    started = time.perf_counter()
+    jobs = [mail.submit(bot.MailJob("reports@example.com", f"report {i}", "body")) for i in range(messages)]
+    while not all(job.done for job in jobs):
+        time.sleep(0.01)
+    seconds = time.perf_counter() - started
+    sent = sum(job.status == "Sent" for job in jobs)
+    return f"{sent / seconds:,.0f} msgs/s, {sent}/{messages} sent over {standin.connections - connections} connections"
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    standin = SMTPStandIn()
+    bot.SMTP_HOST, bot.SMTP_PORT, bot.SMTP_STARTTLS = "127.0.0.1", standin.port, False
+    print("pooled:             ", run(bot.MailQueue(), standin, messages))
+    print("connect per message:", run(ConnectPerMessage(), standin, messages))
+    standin.stop()
+
+
+if __name__ == "__main__":
+    main()
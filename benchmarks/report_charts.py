@@ -0,0 +1,88 @@
+"""Time a 50-chart PDF report cold, warm, and with one chart changed.
+
+    python benchmarks/report_charts.py [--stub-raster SECONDS]
+
+With --stub-raster, Figure.to_image is replaced by a blank PNG after sleeping
+SECONDS, so the run measures the report pipeline without a working kaleido.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bot  # noqa: E402
+
+ROWS = 200_000
+CHARTS = 50
+LINE_OPTIONS = (
+    ("point_budget", 5000), ("full_resolution", False), ("render_choice", "Auto"),
+    ("webgl_min_points", 10000), ("density_min_points", 500000),
+)
+
+
+def stub_to_image(seconds):
+    from PIL import Image
+
+    def to_image(self, format="png", width=None, height=None, **kwargs):
+        time.sleep(seconds)
+        buffer = io.BytesIO()
+        Image.new("RGB", (width, height), "white").save(buffer, "PNG")
+        return buffer.getvalue()
+    go.Figure.to_image = to_image
+
+
+def report_charts():
+    charts = []
+    for graph_type in ["Bar", "Histogram", "Box", "Scatter", "Line"]:
+        for theme_name in list(bot.PLOTLY_THEMES)[:5]:
+            for x, group_by in [("g", None), ("h", "g")]:
+                options = {"Bar": (("bar_agg", "sum"),), "Histogram": (("bins", 50),)}.get(graph_type, ())
+                if graph_type in ("Scatter", "Line"):
+                    x, options = "x", LINE_OPTIONS
+                charts.append(((graph_type, x, "y", group_by, options), theme_name))
+    return charts[:CHARTS]
+
+
+def run(label, backend, stages, charts):
+    started = time.perf_counter()
+    job = bot.ReportJob((label, time.time()), bot.build_report, backend, stages, "Benchmark report", ["g", "h"], charts)
+    path = job.result()
+    timings = " ".join(f"{stage}={seconds:.2f}s" for stage, seconds in job.timings.items())
+    print(f"{label:<12} {time.perf_counter() - started:6.2f}s  {timings}  "
+          f"rendered={job.charts_rendered} reused={job.charts_reused} errors={len(job.chart_errors)}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stub-raster", type=float, metavar="SECONDS")
+    args = parser.parse_args()
+    if args.stub_raster is not None:
+        stub_to_image(args.stub_raster)
+
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "x": rng.normal(size=ROWS), "y": rng.normal(size=ROWS),
+        "g": rng.choice(list("abcdef"), ROWS), "h": rng.choice(list("pqr"), ROWS),
+    })
+    backend = bot.PandasBackend(frame, "benchmark", [])
+    stages = bot.BackgroundStages(backend.version, {"counts": backend.missing_counts, "profile": backend.profile})
+    charts = report_charts()
+    run("cold", backend, stages, charts)
+    run("warm", backend, stages, charts)
+    changed = charts[:-1] + [(("Histogram", "g", "y", None, (("bins", 51),)), charts[-1][1])]
+    path = run("one changed", backend, stages, changed)
+    leftovers = [name for name in os.listdir(bot.REPORT_DIR) if name.startswith("charts-")]
+    print(f"PDF {os.path.getsize(path) / 1024:,.0f} KB, {len(leftovers)} chart directories left in {bot.REPORT_DIR}")
+
+
+if __name__ == "__main__":
+    main()
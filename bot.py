@@ -3,16 +3,49 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go  # <-- Add this for layout updates
-from io import BytesIO
 from fpdf import FPDF
-import base64
 import smtplib
 from email.message import EmailMessage
 from streamlit_extras.stylable_container import stylable_container
 import urllib.parse
-# Temporarily comment out pycaret imports while installing
-# from pycaret.classification import setup as cls_setup, compare_models as cls_compare, pull as cls_pull
-# from pycaret.clustering import setup as clu_setup, create_model as clu_create, assign_model
+import hashlib
+import json
+import os
+import threading
+import multiprocessing
+import queue
+import time
+import weakref
+import csv
+import codecs
+import zlib
+import bz2
+import lzma
+import tempfile
+import shutil
+import copy
+import sys
+import functools
+import inspect
+import pyarrow as pa
+from pyarrow import feather
+from collections import Counter, OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from pandas.api.types import union_categoricals
+from pandas.util import hash_pandas_object
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.experimental import enable_iterative_imputer  # noqa: F401
+from sklearn.impute import IterativeImputer, KNNImputer
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+try:
+    import duckdb
+except ImportError:  # the out-of-core backend is optional
+    duckdb = None
+# pycaret is only imported inside AutoML worker processes (workers.py)
+import workers
 
 # --- Custom Plotly Colors and Layout (moved here for global access) ---
 custom_colors = [
@@ -29,29 +62,2867 @@ custom_plotly_layout = dict(
     margin=dict(l=40, r=40, t=60, b=40),
 )
 
-# --- Custom Plotly Color Themes ---
-PLOTLY_THEMES = {
-    "Vibrant": {
-        "bg": "#181A20",
-        "colors": ['#FF6B6B', '#FFD93D', '#6BCB77', '#4D96FF', '#845EC2', '#FFC75F', '#F9F871', '#00C9A7', '#F76E11', '#FF9671']
-    },
-    "Cool Blues": {
-        "bg": "#23272f",
-        "colors": ['#4D96FF', '#00C9A7', '#0081CF', '#6BCB77', '#B8DE6F', '#23272f', '#181A20', '#FFC75F', '#FFD93D', '#F9F871']
-    },
-    "Sunset": {
-        "bg": "#2d132c",
-        "colors": ['#F76E11', '#FF6B6B', '#FFD93D', '#FF9671', '#845EC2', '#D65DB1', '#FF61A6', '#F9A1BC', '#F7B801', '#EA7317']
-    },
-    "Minty": {
-        "bg": "#1b2e2e",
-        "colors": ['#6BCB77', '#00C9A7', '#B8DE6F', '#3EC300', '#A3A847', '#0081CF', '#4D96FF', '#FFC75F', '#FFD93D', '#F9F871']
-    },
-    "Classic": {
-        "bg": "#222",
-        "colors": px.colors.qualitative.Plotly
-    }
-}
+# --- Custom Plotly Color Themes ---
+PLOTLY_THEMES = {
+    "Vibrant": {
+        "bg": "#181A20",
+        "colors": ['#FF6B6B', '#FFD93D', '#6BCB77', '#4D96FF', '#845EC2', '#FFC75F', '#F9F871', '#00C9A7', '#F76E11', '#FF9671']
+    },
+    "Cool Blues": {
+        "bg": "#23272f",
+        "colors": ['#4D96FF', '#00C9A7', '#0081CF', '#6BCB77', '#B8DE6F', '#23272f', '#181A20', '#FFC75F', '#FFD93D', '#F9F871']
+    },
+    "Sunset": {
+        "bg": "#2d132c",
+        "colors": ['#F76E11', '#FF6B6B', '#FFD93D', '#FF9671', '#845EC2', '#D65DB1', '#FF61A6', '#F9A1BC', '#F7B801', '#EA7317']
+    },
+    "Minty": {
+        "bg": "#1b2e2e",
+        "colors": ['#6BCB77', '#00C9A7', '#B8DE6F', '#3EC300', '#A3A847', '#0081CF', '#4D96FF', '#FFC75F', '#FFD93D', '#F9F871']
+    },
+    "Classic": {
+        "bg": "#222",
+        "colors": px.colors.qualitative.Plotly
+    }
+}
+
+# --- Shared Store (frames and derived results, shared by every session) ---
+# Global memory budget, in MB, across all cached frames and results
+STORE_MEMORY_BUDGET_MB = int(os.environ.get("CSV_BOT_STORE_MB", "2048"))
+# Opening the app with ?admin=<key> shows what the store holds
+STORE_ADMIN_KEY = os.environ.get("CSV_BOT_ADMIN_KEY")
+
+
+def estimate_size(value):
+    """Approximate bytes held by a cached value."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, go.Figure):
+        return estimate_size(value.to_plotly_json())
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class SharedStore:
+    """Process-wide store of read-only frames and derived results.
+
+    Entries are keyed by (namespace, key) and tagged with the dataset version they come
+    from. Eviction goes least recently used first and enforces the global budget plus
+    each namespace's own byte and entry limits. Sessions pin the dataset they have open,
+    which keeps its base frame (an entry in a pinnable namespace tagged exactly with
+    the pinned version); derived results stay evictable.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.tags = {}
+        self.last_used = {}
+        self.used = Counter()
+        self.counts = Counter()
+        self.budgets = {}
+        self.max_entries = {}
+        self.on_evict = {}
+        self.pinnable = set()
+        self.pins = Counter()
+        self.release_hooks = {}
+        self.lock = threading.Lock()
+        self._key_locks = {}
+
+    def register(self, namespace, budget_bytes=None, max_entries=None, on_evict=None, pinnable=False):
+        if budget_bytes is not None:
+            self.budgets[namespace] = budget_bytes
+        if max_entries is not None:
+            self.max_entries[namespace] = max_entries
+        if on_evict is not None:
+            self.on_evict[namespace] = on_evict
+        if pinnable:
+            self.pinnable.add(namespace)
+
+    def used_bytes(self, namespace=None):
+        return self.used[namespace] if namespace else sum(self.used.values())
+
+    def lookup(self, namespace, key):
+        """(True, value) if the entry is resident, else (False, None)."""
+        entry = (namespace, key)
+        with self.lock:
+            if entry not in self.entries:
+                return False, None
+            self.entries.move_to_end(entry)
+            self.last_used[entry] = time.monotonic()
+            return True, self.entries[entry]
+
+    def key_lock(self, namespace, key):
+        """Held while computing an entry, so concurrent sessions compute it once."""
+        with self.lock:
+            return self._key_locks.setdefault((namespace, key), threading.Lock())
+
+    def put(self, namespace, key, value, tag, size=None):
+        entry = (namespace, key)
+        size = estimate_size(value) if size is None else size
+        with self.lock:
+            if entry in self.entries:
+                self.used[namespace] -= self.sizes[entry]
+                self.counts[namespace] -= 1
+            self.entries[entry] = value
+            self.entries.move_to_end(entry)
+            self.sizes[entry], self.tags[entry], self.last_used[entry] = size, tag, time.monotonic()
+            self.used[namespace] += size
+            self.counts[namespace] += 1
+            # The entry just stored is kept even if it alone exceeds a budget
+            budget = self.budgets.get(namespace)
+            if budget is not None:
+                self._evict(lambda: self.used[namespace] <= budget, namespace, keep=entry)
+            max_entries = self.max_entries.get(namespace)
+            if max_entries is not None:
+                self._evict(lambda: self.counts[namespace] <= max_entries, namespace, keep=entry)
+            self._evict(lambda: self.used_bytes() <= self.budget_bytes, keep=entry)
+
+    def pin(self, tag):
+        with self.lock:
+            self.pins[tag] += 1
+
+    def unpin(self, tag):
+        with self.lock:
+            self.pins[tag] -= 1
+            if self.pins[tag] > 0:
+                return
+            del self.pins[tag]
+            hook = self.release_hooks.pop(tag, None)
+        if hook is not None:
+            hook()
+
+    def on_release(self, tag, hook):
+        """Run `hook` once no session has `tag` pinned any more."""
+        with self.lock:
+            self.release_hooks[tag] = hook
+
+    def sessions(self, tag):
+        """Sessions with this version, or the version it derives from, open."""
+        return sum(count for pinned, count in self.pins.items() if tag.startswith(pinned))
+
+    def is_pinned(self, entry):
+        return entry[0] in self.pinnable and self.pins[self.tags[entry]] > 0
+
+    def evict_unpinned(self):
+        with self.lock:
+            self._evict(lambda: False)
+
+    def _evict(self, within_budget, namespace=None, keep=None):
+        for entry in list(self.entries):
+            if within_budget():
+                return
+            if entry == keep or (namespace and entry[0] != namespace) or self.is_pinned(entry):
+                continue
+            del self.entries[entry]
+            self.used[entry[0]] -= self.sizes.pop(entry)
+            self.counts[entry[0]] -= 1
+            self.tags.pop(entry)
+            self.last_used.pop(entry)
+            self._key_locks.pop(entry, None)
+            if entry[0] in self.on_evict:
+                self.on_evict[entry[0]](entry[1])
+
+    def snapshot(self):
+        """One row per resident entry, for the admin view."""
+        now = time.monotonic()
+        with self.lock:
+            return pd.DataFrame([
+                {
+                    "Namespace": namespace,
+                    "Key": str(key)[:80],
+                    "Dataset": self.tags[(namespace, key)],
+                    "MB": self.sizes[(namespace, key)] / 1024**2,
+                    "Sessions": self.sessions(self.tags[(namespace, key)]),
+                    "Pinned": self.is_pinned((namespace, key)),
+                    "Idle (s)": round(now - self.last_used[(namespace, key)]),
+                }
+                for namespace, key in reversed(self.entries)
+            ], columns=["Namespace", "Key", "Dataset", "MB", "Sessions", "Pinned", "Idle (s)"])
+
+
+@st.cache_resource
+def get_shared_store():
+    return SharedStore(STORE_MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+def shared_result(namespace, spinner=None, max_entries=None):
+    """Memoize a function's results in the shared store, keyed like st.cache_resource.
+
+    Parameters starting with an underscore are left out of the key, and the
+    `dataset_version` argument, if any, tags the entry with the data it came from.
+    Results are never pinned; at most `max_entries` are kept in the namespace.
+    """
+    def decorate(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (func.__name__,) + tuple(value for name, value in bound.arguments.items() if not name.startswith("_"))
+            store = get_shared_store()
+            found, value = store.lookup(namespace, key)
+            if found:
+                return value
+            with store.key_lock(namespace, key):
+                found, value = store.lookup(namespace, key)
+                if found:
+                    return value
+                # Background stages call these too; only the script thread can show a spinner
+                if spinner and get_script_run_ctx() is not None:
+                    with st.spinner(spinner):
+                        value = func(*args, **kwargs)
+                else:
+                    value = func(*args, **kwargs)
+                store.register(namespace, max_entries=max_entries)
+                store.put(namespace, key, value, tag=bound.arguments.get("dataset_version", ""))
+            return value
+        return wrapper
+    return decorate
+
+
+class StoreLease:
+    """A session's pin on the dataset it has open, released when replaced or when the session is collected."""
+
+    def __init__(self, store, tag):
+        self.store = store
+        self.tag = tag
+        store.pin(tag)
+        self._finalizer = weakref.finalize(self, store.unpin, tag)
+
+    def release(self):
+        self._finalizer()
+
+    def on_release(self, hook):
+        """Run `hook` once every session using this dataset has released it."""
+        self.store.on_release(self.tag, hook)
+
+
+def session_lease(tag):
+    lease = st.session_state.get("store_lease")
+    if lease is None or lease.tag != tag:
+        if lease is not None:
+            lease.release()
+        lease = st.session_state["store_lease"] = StoreLease(get_shared_store(), tag)
+    return lease
+
+
+def render_store_admin(store):
+    entries = store.snapshot()
+    st.caption(
+        f"{store.used_bytes() / 1024**2:,.1f} of {STORE_MEMORY_BUDGET_MB:,} MB · {len(entries)} entries · "
+        f"{sum(store.pins.values())} session pins"
+    )
+    if len(entries):
+        st.dataframe(entries.groupby("Namespace").agg({"MB": "sum", "Sessions": "max", "Pinned": "sum"}))
+        st.dataframe(entries, hide_index=True)
+    if st.button("Evict unpinned entries"):
+        store.evict_unpinned()
+        st.rerun()
+
+
+# --- Ingestion Cache (shared across reruns and sessions) ---
+# Memory budget for parsed frames, in MB. Least recently used frames are evicted first.
+INGEST_MEMORY_BUDGET_MB = int(os.environ.get("CSV_BOT_CACHE_MB", "1024"))
+# Optional directory for Parquet copies of parsed frames, so they also survive restarts.
+INGEST_SPILL_DIR = os.environ.get("CSV_BOT_SPILL_DIR")
+
+
+class FrameCache:
+    """One namespace of DataFrames in the shared store, with its own budget and optional Parquet spill files."""
+
+    def __init__(self, store, namespace, budget_bytes, spill_dir=None, pinnable=False):
+        self.store = store
+        self.namespace = namespace
+        self.spill_dir = spill_dir
+        self.info = {}
+        self.hits = 0
+        self.misses = 0
+        # Spilled frames can be reloaded, so their load info outlives eviction
+        store.register(
+            namespace, budget_bytes, pinnable=pinnable,
+            on_evict=None if spill_dir else lambda key: self.info.pop(key, None),
+        )
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @property
+    def used_bytes(self):
+        return self.store.used_bytes(self.namespace)
+
+    def size(self, key):
+        return self.store.sizes.get((self.namespace, key), 0)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.parquet")
+
+    def get(self, key):
+        found, frame = self.store.lookup(self.namespace, key)
+        if found:
+            self.hits += 1
+            return frame
+        if self.spill_dir and os.path.exists(self._spill_path(key)):
+            try:
+                frame = pd.read_parquet(self._spill_path(key))
+            except Exception:
+                frame = None
+            if frame is not None:
+                self.hits += 1
+                self._remember(key, frame)
+                return frame
+        self.misses += 1
+        return None
+
+    def put(self, key, frame, info=None):
+        self.info[key] = info or {}
+        self._remember(key, frame)
+        if self.spill_dir and not os.path.exists(self._spill_path(key)):
+            try:
+                frame.to_parquet(self._spill_path(key))
+            except Exception:
+                # Mixed-type object columns can't always be written; memory caching still applies
+                pass
+
+    def _remember(self, key, frame):
+        # Every key starts with the dataset hash, so it doubles as the entry's tag
+        self.store.put(self.namespace, key, frame, tag=key, size=int(frame.memory_usage(deep=True).sum()))
+
+
+@st.cache_resource
+def get_ingest_cache():
+    # Parsed uploads are the base frames sessions pin; everything derived from them stays evictable
+    return FrameCache(get_shared_store(), "ingest", INGEST_MEMORY_BUDGET_MB * 1024 * 1024, INGEST_SPILL_DIR, pinnable=True)
+
+
+def upload_digest(uploaded_file):
+    """Content hash of an upload, computed once per upload and remembered in the session."""
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+    return digests[uploaded_file.file_id]
+
+
+def uploads_digest(uploaded_files):
+    """Content hash of a set of uploads; a single file hashes as it does on its own."""
+    if len(uploaded_files) == 1:
+        return upload_digest(uploaded_files[0])
+    parts = "\n".join(f"{uploaded_file.name}:{upload_digest(uploaded_file)}" for uploaded_file in uploaded_files)
+    return hashlib.blake2b(parts.encode(), digest_size=16).hexdigest()
+
+
+# --- Memory-optimized CSV Loader ---
+LOAD_MODES = {"Standard": "std", "Memory-optimized": "compact"}
+DTYPE_SAMPLE_ROWS = 10_000
+CSV_CHUNK_ROWS = 250_000
+# Text columns whose distinct values in the sample stay under this share of rows become `category`
+CATEGORY_MAX_RATIO = 0.5
+
+
+def _downcast_chunk(chunk, category_cols):
+    for col in chunk.columns:
+        series = chunk[col]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            chunk[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            # Only narrow floats when every value survives the float32 round trip
+            narrowed = series.astype("float32")
+            if np.array_equal(narrowed.to_numpy("float64"), series.to_numpy("float64"), equal_nan=True):
+                chunk[col] = narrowed
+        elif col in category_cols:
+            chunk[col] = series.astype("category")
+    return chunk
+
+
+def _as_text(series):
+    """Values as the strings a text column would hold; whole floats drop the ".0" they gained as numbers."""
+    if pd.api.types.is_float_dtype(series) and np.array_equal(series.dropna(), series.dropna().round()):
+        series = series.astype("Int64")
+    return series.astype(str).where(series.notna())
+
+
+def _unify_chunk_types(chunks, text_cols):
+    """Give each column one type across chunks before they are concatenated.
+
+    A column sampled as numbers that turns up as text in a later chunk is read as text
+    throughout, so the result never mixes numbers and strings in one object column;
+    booleans with gaps in some chunks become the nullable boolean type.
+    """
+    for col in chunks[0].columns:
+        if col in text_cols or all(chunk[col].dtype != object for chunk in chunks):
+            continue
+        kinds = {pd.api.types.infer_dtype(chunk[col], skipna=True) for chunk in chunks if chunk[col].notna().any()}
+        if len(kinds) <= 1 and len({chunk[col].dtype for chunk in chunks}) == 1:
+            continue
+        unify = (lambda series: series.astype("boolean")) if kinds == {"boolean"} else _as_text
+        for chunk in chunks:
+            chunk[col] = unify(chunk[col])
+
+
+def read_csv_chunked(source, **read_kwargs):
+    """Stream a CSV in chunks with sample-inferred dtypes, downcasting each chunk as it arrives.
+
+    Returns the frame and the memory it would have taken with default dtypes.
+    """
+    sample = pd.read_csv(source, nrows=DTYPE_SAMPLE_ROWS, **read_kwargs)
+    source.seek(0)
+    object_cols = sample.select_dtypes(include="object").columns.tolist()
+    category_cols = [
+        col for col in object_cols
+        if sample[col].nunique() <= CATEGORY_MAX_RATIO * max(sample[col].count(), 1)
+    ]
+
+    chunks = []
+    raw_bytes = 0
+    # Pin sampled text columns to object so a numeric-looking chunk can't change their type
+    reader = pd.read_csv(
+        source, dtype={col: "object" for col in object_cols}, chunksize=CSV_CHUNK_ROWS, **read_kwargs
+    )
+    for chunk in reader:
+        raw_bytes += int(chunk.memory_usage(deep=True).sum())
+        chunks.append(_downcast_chunk(chunk, category_cols))
+
+    if not chunks:
+        return sample, {"raw_bytes": int(sample.memory_usage(deep=True).sum())}
+
+    _unify_chunk_types(chunks, object_cols)
+    # Give every chunk the same categories so concat keeps the category dtype
+    for col in category_cols:
+        categories = union_categoricals([chunk[col] for chunk in chunks]).categories
+        for chunk in chunks:
+            chunk[col] = chunk[col].cat.set_categories(categories)
+    frame = pd.concat(chunks, ignore_index=True)
+    return frame, {"raw_bytes": raw_bytes}
+
+
+# --- Format Sniffing & Arrow Parsing ---
+SNIFF_BYTES = 64 * 1024
+SNIFF_DELIMITERS = ",;\t|"
+COMPRESSION_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"\xfd7zXZ\x00": "xz",
+    b"PK\x03\x04": "zip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+# Streaming decompressors that can inflate just the first few KB for sniffing
+HEAD_DECOMPRESSORS = {
+    "gzip": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    "bz2": bz2.BZ2Decompressor,
+    "xz": lzma.LZMADecompressor,
+}
+
+
+def sniff_upload(head, filename):
+    """Detect format, compression, encoding and delimiter from the first bytes of an upload."""
+    if head.startswith(b"PAR1"):
+        return {"format": "parquet"}
+
+    compression = next((name for magic, name in COMPRESSION_MAGIC.items() if head.startswith(magic)), None)
+    if compression in HEAD_DECOMPRESSORS:
+        try:
+            head = HEAD_DECOMPRESSORS[compression]().decompress(head)
+        except Exception:
+            head = b""
+    elif compression:
+        # zip/zstd can't be inflated from a prefix here; fall back to defaults below
+        head = b""
+
+    if head.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    elif head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = "utf-16"
+    else:
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+
+    default_sep = "\t" if ".tsv" in filename.lower() else ","
+    text = head.decode(encoding, errors="ignore")
+    # Drop the (probably truncated) last line before sniffing
+    text = text[:text.rfind("\n")] if "\n" in text else text
+    try:
+        sep = csv.Sniffer().sniff(text, delimiters=SNIFF_DELIMITERS).delimiter if text else default_sep
+    except csv.Error:
+        sep = default_sep
+    return {"format": "csv", "compression": compression, "encoding": encoding, "sep": sep}
+
+
+def read_delimited(source, sniffed, arrow_dtypes=False):
+    """Parse with pyarrow's multithreaded reader, falling back to the C parser."""
+    read_kwargs = dict(sep=sniffed["sep"], encoding=sniffed["encoding"], compression=sniffed["compression"])
+    if arrow_dtypes:
+        read_kwargs["dtype_backend"] = "pyarrow"
+    try:
+        return pd.read_csv(source, engine="pyarrow", **read_kwargs), "pyarrow"
+    except Exception:
+        source.seek(0)
+        return pd.read_csv(source, **read_kwargs), "c"
+
+
+def load_dataset(uploaded_file, load_mode="Standard", arrow_dtypes=False):
+    cache = get_ingest_cache()
+    arrow_dtypes = arrow_dtypes and load_mode == "Standard"
+    key = f"{upload_digest(uploaded_file)}-{LOAD_MODES[load_mode]}{'-arrow' if arrow_dtypes else ''}"
+    frame = cache.get(key)
+    if frame is None:
+        sniffed = sniff_upload(uploaded_file.getvalue()[:SNIFF_BYTES], uploaded_file.name)
+        if sniffed["format"] == "parquet":
+            frame = pd.read_parquet(uploaded_file, **({"dtype_backend": "pyarrow"} if arrow_dtypes else {}))
+            info = {"parser": "parquet"}
+        elif load_mode == "Memory-optimized":
+            frame, info = read_csv_chunked(
+                uploaded_file, sep=sniffed["sep"], encoding=sniffed["encoding"], compression=sniffed["compression"]
+            )
+            info["parser"] = "c (chunked)"
+        else:
+            frame, parser = read_delimited(uploaded_file, sniffed, arrow_dtypes)
+            info = {"parser": parser}
+        info.setdefault("raw_bytes", int(frame.memory_usage(deep=True).sum()))
+        info["sniffed"] = sniffed
+        cache.put(key, frame, info)
+    # Shallow copy: column assignments and row drops below never touch the cached frame
+    return frame.copy(deep=False), key
+
+
+# --- Multi-file Upload ---
+PARSE_WORKERS = min(8, os.cpu_count() or 1)
+SOURCE_FILE_COLUMN = "source_file"
+
+
+def source_file_column(columns):
+    """SOURCE_FILE_COLUMN, suffixed with _2, _3, ... if the files already have a column by that name."""
+    name, suffix = SOURCE_FILE_COLUMN, 1
+    while name in columns:
+        suffix += 1
+        name = f"{SOURCE_FILE_COLUMN}_{suffix}"
+    return name
+
+
+@st.cache_resource
+def get_parse_executor():
+    return ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def promote_types(types):
+    """A type every part's column can be cast to: wider numbers, common timestamps, else strings."""
+    types = [t.value_type if pa.types.is_dictionary(t) else t for t in types if not pa.types.is_null(t)]
+    if not types:
+        return pa.null()
+    if all(t == types[0] for t in types):
+        return types[0]
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_boolean(t) for t in types):
+        return pa.float64() if any(pa.types.is_floating(t) for t in types) else pa.int64()
+    if all(pa.types.is_timestamp(t) or pa.types.is_date(t) for t in types):
+        return pa.timestamp("ns")
+    return pa.large_string()
+
+
+def reconcile_schemas(tables):
+    """Give every part the union of all columns (first-seen order), each cast to its promoted type."""
+    column_types = {}
+    for table in tables:
+        for field in table.schema:
+            column_types.setdefault(field.name, []).append(field.type)
+    schema = pa.schema([(name, promote_types(types)) for name, types in column_types.items()])
+    aligned = []
+    for table in tables:
+        columns = [
+            table.column(field.name).cast(field.type) if field.name in table.column_names else pa.nulls(table.num_rows, field.type)
+            for field in schema
+        ]
+        aligned.append(pa.Table.from_arrays(columns, schema=schema))
+    return aligned
+
+
+def load_datasets(uploaded_files, load_mode="Standard", arrow_dtypes=False):
+    """Parse several uploads in parallel worker processes into one dataset with a source-file column."""
+    cache = get_ingest_cache()
+    arrow_dtypes = arrow_dtypes and load_mode == "Standard"
+    key = f"{uploads_digest(uploaded_files)}-{LOAD_MODES[load_mode]}{'-arrow' if arrow_dtypes else ''}"
+    frame = cache.get(key)
+    if frame is None:
+        sniffed = [
+            sniff_upload(bytes(uploaded_file.getbuffer()[:SNIFF_BYTES]), uploaded_file.name) for uploaded_file in uploaded_files
+        ]
+        # Workers read the spilled files from disk rather than receiving the bytes; the files go once parsed
+        with tempfile.TemporaryDirectory(prefix="parse-", dir=duckdb_work_dir()) as parse_dir:
+            paths = [spill_upload(uploaded_file, parse_dir)[0] for uploaded_file in uploaded_files]
+            file_mb = [os.path.getsize(path) / 1024**2 for path in paths]
+            started = time.perf_counter()
+            parsed = list(get_parse_executor().map(workers.parse_file, paths, sniffed))
+            parse_seconds = time.perf_counter() - started
+        names = list(dict.fromkeys(uploaded_file.name for uploaded_file in uploaded_files))
+        if len(names) < len(uploaded_files):
+            names = [f"{i}: {uploaded_file.name}" for i, uploaded_file in enumerate(uploaded_files, start=1)]
+        files = pd.DataFrame({
+            "File": names,
+            "Rows": [table.num_rows for table, _, _ in parsed],
+            "MB": file_mb,
+            "Parser": [parser for _, parser, _ in parsed],
+            "Seconds": [seconds for _, _, seconds in parsed],
+        })
+        # concat_tables only chains the parts' buffers; to_pandas is the one copy, releasing Arrow memory as it goes
+        table = pa.concat_tables(reconcile_schemas([table for table, _, _ in parsed]))
+        del parsed
+        frame = table.to_pandas(
+            types_mapper=pd.ArrowDtype if arrow_dtypes else None, split_blocks=True, self_destruct=True
+        )
+        del table
+        if load_mode == "Memory-optimized":
+            sample = frame.head(DTYPE_SAMPLE_ROWS)
+            frame = _downcast_chunk(frame, [
+                col for col in sample.select_dtypes(include="object").columns
+                if sample[col].nunique() <= CATEGORY_MAX_RATIO * max(sample[col].count(), 1)
+            ])
+        frame[source_file_column(frame.columns)] = pd.Categorical.from_codes(np.repeat(np.arange(len(names)), files["Rows"]), categories=names)
+        info = {
+            "parser": "parallel",
+            "raw_bytes": int(frame.memory_usage(deep=True).sum()),
+            "sniffed": sniffed[0],
+            "files": files,
+            "parse_seconds": parse_seconds,
+        }
+        cache.put(key, frame, info)
+    return frame.copy(deep=False), key
+
+
+# --- Cleaning Pipeline ---
+# Memory budget for intermediate results of cleaning steps, in MB
+PIPELINE_MEMORY_BUDGET_MB = int(os.environ.get("CSV_BOT_PIPELINE_CACHE_MB", "512"))
+FILL_STRATEGIES = {"Fill with Mean": "mean", "Fill with Median": "median", "Fill with Mode": "mode"}
+IMPUTE_STRATEGIES = {
+    "Mean": "mean", "Median": "median", "Mode": "mode",
+    "KNN (nearest rows)": "knn", "Iterative (regression on other columns)": "iterative",
+}
+# Strategies that fit a scikit-learn imputer, so they need the data in memory
+MODEL_IMPUTERS = ("knn", "iterative")
+# Model-based imputers are fit on a sample of this many rows, then fill the incomplete rows in chunks
+IMPUTE_SAMPLE_ROWS = int(os.environ.get("CSV_BOT_IMPUTE_ROWS", "20000"))
+# KNN compares every incomplete row with every sampled row, so it gets a smaller sample
+KNN_SAMPLE_ROWS = int(os.environ.get("CSV_BOT_KNN_ROWS", "2000"))
+IMPUTE_CHUNK_ROWS = 10_000
+IMPUTE_SEED = 0
+KNN_NEIGHBORS = 5
+
+
+@st.cache_resource
+def get_pipeline_cache():
+    return FrameCache(get_shared_store(), "pipeline", PIPELINE_MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+def ops_digest(ops):
+    return hashlib.blake2b(json.dumps(ops, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def describe_op(op):
+    if op["op"] == "dropna":
+        return f"Drop rows with missing '{op['column']}'"
+    if op["op"] == "fillna":
+        return f"Fill missing '{op['column']}' with {op['strategy']}"
+    if op["op"] == "impute":
+        return f"Impute {len(op['columns'])} columns with {op['strategy']}: " + ", ".join(f"'{col}'" for col in op["columns"])
+    if op["op"] == "drop_duplicates" and op.get("columns"):
+        return "Remove rows duplicated on " + ", ".join(f"'{col}'" for col in op["columns"])
+    if op["op"] == "drop_duplicates":
+        return "Remove duplicate rows"
+    return op["op"]
+
+
+def filled_columns(op):
+    """Columns a fill step writes to; empty for steps that drop rows."""
+    if op["op"] == "fillna":
+        return [op["column"]]
+    if op["op"] == "impute":
+        return list(op["columns"])
+    return []
+
+
+def _fit_dtype(values, dtype):
+    """Imputed values rounded for integer columns, so a fill keeps the column's dtype."""
+    return np.round(values) if pd.api.types.is_integer_dtype(dtype) else values
+
+
+def fill_values(frame, columns, strategy):
+    """Fill value per column from one reduction over all of them; columns the strategy can't fill are left out."""
+    if strategy == "mode":
+        modes = frame[columns].mode()
+        return {col: modes[col].iloc[0] for col in columns if len(modes) and pd.notna(modes[col].iloc[0])}
+    numeric = [col for col in columns if column_kind(frame[col].dtype) == "numeric"]
+    stats = getattr(frame[numeric], strategy)()
+    return {col: _fit_dtype(value, frame[col].dtype) for col, value in stats.items() if pd.notna(value)}
+
+
+def model_impute(frame, columns, strategy):
+    """Fill numeric `columns` with a KNN or iterative imputer, using every numeric column as a predictor.
+
+    The imputer is fit on a sample and only transforms rows missing a value in `columns`.
+    """
+    # Fitting on every row would cost quadratic time (KNN) or many full passes (iterative)
+    sample_rows = KNN_SAMPLE_ROWS if strategy == "knn" else IMPUTE_SAMPLE_ROWS
+    sample = frame[[col for col in frame.columns if column_kind(frame[col].dtype) == "numeric"]]
+    sample = sample.sample(min(len(frame), sample_rows), random_state=IMPUTE_SEED)
+    # Columns with no values in the sample have nothing to learn from and are left as they are
+    features = sample.columns[sample.notna().any()].tolist()
+    targets = [col for col in columns if col in features]
+    missing = frame[targets].isna().to_numpy()
+    rows = np.flatnonzero(missing.any(axis=1))
+    if not len(rows):
+        return frame
+    if strategy == "knn":
+        imputer = KNNImputer(n_neighbors=KNN_NEIGHBORS)
+    else:
+        imputer = IterativeImputer(max_iter=10, random_state=IMPUTE_SEED)
+    # Standardized, so KNN distances aren't dominated by whichever column has the widest range
+    fitted = sample[features].to_numpy(dtype="float64", na_value=np.nan)
+    center = np.nanmean(fitted, axis=0)
+    scale = np.nanstd(fitted, axis=0)
+    scale[scale == 0] = 1
+    imputer.fit((fitted - center) / scale)
+    values = (frame[features].iloc[rows].to_numpy(dtype="float64", na_value=np.nan) - center) / scale
+    for start in range(0, len(rows), IMPUTE_CHUNK_ROWS):
+        values[start:start + IMPUTE_CHUNK_ROWS] = imputer.transform(values[start:start + IMPUTE_CHUNK_ROWS])
+    values = values * scale + center
+    cleaned = frame.copy(deep=False)
+    for i, col in enumerate(targets):
+        filled = missing[:, i][rows]
+        if filled.any():
+            column = frame[col].copy()
+            column.iloc[rows[filled]] = pd.array(
+                _fit_dtype(values[filled, features.index(col)], column.dtype)
+            ).astype(column.dtype)
+            cleaned[col] = column
+    return cleaned
+
+
+def apply_cleaning_op(frame, op):
+    if op["op"] == "dropna":
+        return frame.dropna(subset=[op["column"]])
+    if op["op"] in ("fillna", "impute"):
+        columns = filled_columns(op)
+        if op["strategy"] in MODEL_IMPUTERS:
+            return model_impute(frame, columns, op["strategy"])
+        values = fill_values(frame, columns, op["strategy"])
+        if not values:
+            return frame
+        cleaned = frame.copy(deep=False)
+        for col, value in values.items():
+            cleaned[col] = frame[col].fillna(value)
+        return cleaned
+    if op["op"] == "drop_duplicates":
+        return frame.drop_duplicates(subset=op.get("columns"))
+    raise ValueError(f"Unknown cleaning step: {op['op']}")
+
+
+def step_changes(before, after, op):
+    """What one step did: cells filled for fill steps, rows removed otherwise."""
+    columns = filled_columns(op)
+    if columns:
+        return {"cells": int(before[columns].isna().to_numpy().sum() - after[columns].isna().to_numpy().sum())}
+    return {"rows": len(before) - len(after)}
+
+
+def describe_step_info(info):
+    if not info:
+        return ""
+    change = f"{info['cells']:,} cells filled" if "cells" in info else f"{info['rows']:,} rows removed"
+    return f" · {info['seconds']:.2f}s · {change}"
+
+
+def run_cleaning_pipeline(frame, dataset_hash, ops):
+    """Apply the recorded steps, resuming from the longest prefix that was already computed."""
+    cache = get_pipeline_cache()
+    start, current = 0, frame
+    for end in range(len(ops), 0, -1):
+        cached = cache.get(f"{dataset_hash}-{ops_digest(ops[:end])}")
+        if cached is not None:
+            start, current = end, cached
+            break
+    for end in range(start + 1, len(ops) + 1):
+        op = ops[end - 1]
+        previous, started = current, time.perf_counter()
+        if op["op"] == "drop_duplicates":
+            # The duplicate index of the previous step already knows which rows repeat
+            current = current[~duplicate_index(current, dataset_hash, ops[:end - 1], op.get("columns")).duplicated()]
+        else:
+            current = apply_cleaning_op(current, op)
+        seconds = time.perf_counter() - started
+        cache.put(f"{dataset_hash}-{ops_digest(ops[:end])}", current, {"seconds": seconds, **step_changes(previous, current, op)})
+    return current.copy(deep=False)
+
+
+def pipeline_step_info(dataset_hash, ops):
+    """Timing and change counts of each step, for steps whose result is still cached."""
+    info = get_pipeline_cache().info
+    return [info.get(f"{dataset_hash}-{ops_digest(ops[:end])}") for end in range(1, len(ops) + 1)]
+
+
+def validate_ops(ops, columns, exported_columns=None):
+    """Check that a replayed step log is well formed and only references columns that exist in this dataset.
+
+    `exported_columns` is the schema the steps were exported from; replay needs the same columns.
+    """
+    if exported_columns is not None and set(exported_columns) != set(columns):
+        missing, extra = set(exported_columns) - set(columns), set(columns) - set(exported_columns)
+        raise ValueError("Steps were exported from a different schema: " + "; ".join(
+            f"{label} {', '.join(repr(col) for col in sorted(cols))}"
+            for label, cols in (("missing", missing), ("unexpected", extra)) if cols
+        ))
+    if not isinstance(ops, list) or not all(isinstance(op, dict) for op in ops):
+        raise ValueError("Steps must be a list of cleaning steps")
+    for op in ops:
+        if op.get("op") not in ("dropna", "fillna", "impute", "drop_duplicates"):
+            raise ValueError(f"Unknown cleaning step: {op.get('op')}")
+        if op["op"] in ("dropna", "fillna") and "column" not in op:
+            raise ValueError(f"'{op['op']}' step needs a column")
+        if op["op"] == "impute" and not (isinstance(op.get("columns"), list) and op["columns"]):
+            raise ValueError("'impute' step needs a non-empty list of columns")
+        if "column" in op and op["column"] not in columns:
+            raise ValueError(f"Column '{op['column']}' not found in this dataset")
+        if not isinstance(op.get("columns") or [], list):
+            raise ValueError(f"'{op['op']}' step columns must be a list")
+        for col in op.get("columns") or []:
+            if col not in columns:
+                raise ValueError(f"Column '{col}' not found in this dataset")
+        if op["op"] == "fillna" and op.get("strategy") not in FILL_STRATEGIES.values():
+            raise ValueError(f"Unknown fill strategy: {op.get('strategy')}")
+        if op["op"] == "impute" and op.get("strategy") not in IMPUTE_STRATEGIES.values():
+            raise ValueError(f"Unknown imputation strategy: {op.get('strategy')}")
+    return ops
+
+
+# --- Duplicate Index ---
+# Memory budget for row-hash indexes, in MB
+DUPLICATE_INDEX_BUDGET_MB = int(os.environ.get("CSV_BOT_DUPLICATE_CACHE_MB", "256"))
+
+
+@st.cache_resource
+def get_duplicate_index_cache():
+    return FrameCache(get_shared_store(), "duplicates", DUPLICATE_INDEX_BUDGET_MB * 1024 * 1024)
+
+
+def row_hashes(frame, columns):
+    return hash_pandas_object(frame[columns], index=False).to_numpy()
+
+
+class DuplicateIndex:
+    """64-bit hashes of each row on a column subset, keyed by row label.
+
+    Rows with equal hashes are treated as duplicates; with 64-bit hashes a false match needs
+    billions of rows to become likely. Cleaning steps only rehash the rows they filled, and
+    dropped rows simply leave the index.
+    """
+
+    def __init__(self, columns, state):
+        self.columns = columns
+        # One row per frame row: the hash plus null flags for each subset column
+        self.state = state
+
+    @classmethod
+    def build(cls, frame, columns):
+        state = pd.DataFrame({"hash": row_hashes(frame, columns)}, index=frame.index)
+        for i, col in enumerate(columns):
+            state[f"null_{i}"] = frame[col].isna().to_numpy()
+        return cls(columns, state)
+
+    def update(self, frame, ops):
+        """Index of `frame`, the result of applying `ops` to the frame this index describes."""
+        if not frame.index.is_unique:
+            return DuplicateIndex.build(frame, self.columns)
+        state = self.state if self.state.index.equals(frame.index) else self.state.loc[frame.index]
+        # A fill can only change rows that were missing in the filled column
+        changed = np.zeros(len(state), dtype=bool)
+        for op in ops:
+            for col in filled_columns(op):
+                if col in self.columns:
+                    changed |= state[f"null_{self.columns.index(col)}"].to_numpy()
+        if changed.any():
+            state = state.copy()
+            rows = frame.iloc[changed]
+            state.loc[changed, "hash"] = row_hashes(rows, self.columns)
+            for i, col in enumerate(self.columns):
+                state.loc[changed, f"null_{i}"] = rows[col].isna().to_numpy()
+        return DuplicateIndex(self.columns, state)
+
+    def duplicated(self):
+        """Mask of rows that repeat an earlier row, like DataFrame.duplicated()."""
+        return self.state["hash"].duplicated().to_numpy()
+
+    @property
+    def duplicate_count(self):
+        return int(self.duplicated().sum())
+
+
+def duplicate_index(frame, dataset_hash, ops, columns=None):
+    """Duplicate index of the cleaned frame, updated from the longest prefix of steps already indexed."""
+    columns = list(columns or frame.columns)
+    cache = get_duplicate_index_cache()
+    # Dtypes are part of the key: a step that changes a dtype changes every hash, so the index is rebuilt
+    subset = ops_digest([[col, str(frame[col].dtype)] for col in columns])
+    index = None
+    for end in range(len(ops), -1, -1):
+        state = cache.get(f"{dataset_hash}-{subset}-{ops_digest(ops[:end])}")
+        if state is not None:
+            index = DuplicateIndex(columns, state).update(frame, ops[end:])
+            break
+    if index is None:
+        index = DuplicateIndex.build(frame, columns)
+    cache.put(f"{dataset_hash}-{subset}-{ops_digest(ops)}", index.state)
+    return index
+
+
+# --- Datetime Detection ---
+DATETIME_SAMPLE_SIZE = 200
+# Share of sampled values that must parse before a column counts as datetime
+DATETIME_MIN_MATCH = 0.9
+KNOWN_DATETIME_FORMATS = [
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S.%f",
+    "%Y/%m/%d", "%Y/%m/%d %H:%M:%S", "%m/%d/%Y", "%d/%m/%Y", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M",
+    "%m/%d/%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%d-%m-%Y", "%d.%m.%Y", "%d %b %Y", "%b %d, %Y",
+    "%d %B %Y", "%B %d, %Y", "%Y%m%d", "ISO8601",
+]
+# Month-first formats and their day-first twins; month-first wins unless only the twin parses
+DAY_FIRST_FORMATS = {
+    "%m/%d/%Y": "%d/%m/%Y", "%m/%d/%Y %H:%M": "%d/%m/%Y %H:%M", "%m/%d/%Y %H:%M:%S": "%d/%m/%Y %H:%M:%S",
+}
+# The only format plain digit strings may match; years and other bare numbers are not dates
+DIGITS_DATETIME_FORMAT = "%Y%m%d"
+
+
+def sniff_datetime_format(series):
+    """Return (format, twin) for the known format that best parses a sample of the column.
+
+    The format is None if nothing parses; the twin is the day-first format when the
+    sample reads equally well both ways, so the pick is a guess worth flagging.
+    """
+    sample = series.dropna()
+    if len(sample) > DATETIME_SAMPLE_SIZE:
+        sample = sample.sample(DATETIME_SAMPLE_SIZE, random_state=0)
+    if sample.empty:
+        return None, None
+    sample = sample.astype(str).str.strip()
+    digits = sample.str.fullmatch(r"\d+").to_numpy()
+
+    def match_ratio(fmt):
+        parsed = pd.to_datetime(sample, format=fmt, errors="coerce").notna().to_numpy()
+        return (parsed if fmt == DIGITS_DATETIME_FORMAT else parsed & ~digits).mean()
+
+    best_format, best_ratio = None, DATETIME_MIN_MATCH
+    for fmt in KNOWN_DATETIME_FORMATS:
+        ratio = match_ratio(fmt)
+        if ratio >= best_ratio and (best_format is None or ratio > best_ratio):
+            best_format, best_ratio = fmt, ratio
+            if ratio == 1.0:
+                break
+    twin = DAY_FIRST_FORMATS.get(best_format)
+    return best_format, twin if twin and match_ratio(twin) >= best_ratio else None
+
+
+def _parse_datetimes(series, fmt):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Parse each category once, then broadcast through the codes
+        parsed = pd.to_datetime(series.cat.categories.astype(str), format=fmt, errors="coerce")
+        values = parsed.take(series.cat.codes.to_numpy(), allow_fill=True, fill_value=pd.NaT)
+        return pd.Series(values, index=series.index, name=series.name)
+    return pd.to_datetime(series, format=fmt, errors="coerce")
+
+
+@shared_result("datetimes", max_entries=16)
+def detect_datetime_columns(_frame, dataset_version):
+    """Map each datetime-like column to its parsed values, leaving the frame itself untouched.
+
+    Only text columns are probed, and only a sample of each; confirmed columns are then
+    converted once with an explicit format. Returns (parsed, notes), where notes explains
+    columns whose dates read just as well day-first as month-first.
+    """
+    converted, notes = {}, {}
+    for col in _frame.columns:
+        series = _frame[col]
+        if series.dtype.kind == "M":
+            converted[col] = series
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series) \
+                or isinstance(series.dtype, pd.CategoricalDtype):
+            fmt, twin = sniff_datetime_format(series)
+            if fmt:
+                converted[col] = _parse_datetimes(series, fmt)
+            if twin:
+                notes[col] = f"{col} parses as both {fmt} and {twin}; reading it month-first ({fmt})."
+    return converted, notes
+
+
+# --- Time Series ---
+# Resample frequencies from finest to coarsest: label -> (pandas alias, DuckDB interval)
+TIME_SERIES_FREQUENCIES = {
+    "Minute": ("min", "1 minute"),
+    "Hour": ("h", "1 hour"),
+    "Day": ("D", "1 day"),
+    # Monday-start weeks labelled by their Monday, matching DuckDB's time_bucket
+    "Week": ("W-MON", "1 week"),
+}
+# Aggregation label -> (pandas name, DuckDB function)
+TIME_SERIES_AGGREGATIONS = {
+    "Mean": ("mean", "avg"),
+    "Sum": ("sum", "sum"),
+    "Min": ("min", "min"),
+    "Max": ("max", "max"),
+    "Median": ("median", "median"),
+    "Count": ("count", "count"),
+}
+# Most buckets a time-series chart draws
+TIME_SERIES_MAX_POINTS = 2_000
+
+
+def pick_frequency(start, end, finest=None, rows=None):
+    """Finest frequency, no finer than `finest`, that splits start..end into at most
+    TIME_SERIES_MAX_POINTS buckets, and no more buckets than there are rows so sparse data isn't drawn as gaps.
+    """
+    max_points = min(TIME_SERIES_MAX_POINTS, rows) if rows else TIME_SERIES_MAX_POINTS
+    labels = list(TIME_SERIES_FREQUENCIES)
+    labels = labels[labels.index(finest):] if finest else labels
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for label in labels:
+        # Drop the anchor ("W-MON" -> "W") to get the bucket width
+        if span / pd.Timedelta("1" + TIME_SERIES_FREQUENCIES[label][0].split("-")[0]) <= max_points:
+            return label
+    return labels[-1]
+
+
+@shared_result("time-index", spinner="Indexing timestamps...", max_entries=16)
+def sorted_time_index(_frame, dataset_version, dt_col):
+    """A column's parsed timestamps in ascending order (naive UTC, no missing values) and the row position of each."""
+    times = detect_datetime_columns(_frame, dataset_version)[0][dt_col]
+    valid = times.notna().to_numpy()
+    index = pd.DatetimeIndex(times[valid])
+    if index.tz is not None:
+        index = index.tz_convert(None)
+    order = index.argsort(kind="stable")
+    return index[order].rename(dt_col), np.flatnonzero(valid)[order]
+
+
+# --- Heavy Hitters ---
+# Columns with more distinct values than this (judged from a sample) get approximate top-k counts
+TOP_K_EXACT_MAX_UNIQUE = 10_000
+TOP_K_SAMPLE_ROWS = 20_000
+# Counters kept per column; estimates are off by at most rows / (TOP_K_COUNTERS + 1)
+TOP_K_COUNTERS = 1_000
+TOP_K_CHUNK_ROWS = 200_000
+
+
+def _reduce_counters(counts, size):
+    """Misra-Gries step: keep the `size` largest counters, less the next-largest count."""
+    if len(counts) <= size:
+        return counts, 0
+    counts = counts.sort_values(ascending=False, kind="stable")
+    cut = counts.iloc[size]
+    kept = counts.iloc[:size] - cut
+    return kept[kept > 0], int(cut)
+
+
+def is_high_cardinality(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return False  # counted per category code, no hash table needed
+    sample = series.iloc[::max(1, len(series) // TOP_K_SAMPLE_ROWS)]
+    return sample.nunique(dropna=False) > TOP_K_EXACT_MAX_UNIQUE
+
+
+def heavy_hitters(series, counters=TOP_K_COUNTERS, chunk_rows=TOP_K_CHUNK_ROWS):
+    """Approximate value counts from mergeable Misra-Gries summaries over row chunks.
+
+    Only `counters` values are held between chunks, so memory stays bounded on ID-like
+    columns. Returns the estimated counts and the error bound: each value's true count lies
+    between its estimate and estimate + error.
+    """
+    summary, error = pd.Series(dtype="int64"), 0
+    for start in range(0, len(series), chunk_rows):
+        # Summarize the chunk on its own first, so merging only aligns two small summaries
+        chunk_summary, chunk_cut = _reduce_counters(series.iloc[start:start + chunk_rows].value_counts(dropna=False), counters)
+        summary, cut = _reduce_counters(summary.add(chunk_summary, fill_value=0).astype("int64"), counters)
+        error += chunk_cut + cut
+    return summary.sort_values(ascending=False, kind="stable"), error
+
+
+# --- Column Profiler ---
+PROFILE_TOP_K = 5
+PROFILE_WORKERS = min(8, os.cpu_count() or 1)
+DESCRIBE_STATS = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+
+def column_kind(dtype):
+    """"numeric", "categorical" (text/category) or "other", from the dtype alone."""
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        return "numeric"
+    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype) \
+            or isinstance(dtype, pd.CategoricalDtype):
+        return "categorical"
+    return "other"
+
+
+def _profile_column(series):
+    """Counts, nulls, moments, quantiles, top values and cardinality of one column."""
+    nulls = int(series.isna().sum())
+    stats = {"dtype": str(series.dtype), "count": len(series) - nulls, "nulls": nulls, "kind": column_kind(series.dtype)}
+    if stats["kind"] == "numeric":
+        values = series.to_numpy(dtype="float64", na_value=np.nan)
+        # One sort gives min/max, quantiles and the distinct count
+        values = np.sort(values[~np.isnan(values)])
+        stats["unique"] = int(np.count_nonzero(np.diff(values))) + 1 if len(values) else 0
+        stats["unique"] += int(nulls > 0)
+        if len(values):
+            positions = np.array([0.25, 0.5, 0.75]) * (len(values) - 1)
+            lower = np.floor(positions).astype(int)
+            upper = np.ceil(positions).astype(int)
+            quantiles = values[lower] + (values[upper] - values[lower]) * (positions - lower)
+            stats.update({
+                "mean": values.mean(),
+                "std": values.std(ddof=1) if len(values) > 1 else np.nan,
+                "min": values[0], "25%": quantiles[0], "50%": quantiles[1], "75%": quantiles[2], "max": values[-1],
+            })
+        stats["top"] = None
+    else:
+        if is_high_cardinality(series):
+            counts, stats["top_error"] = heavy_hitters(series)
+            stats["unique"] = np.nan  # not tracked by the summary
+        else:
+            counts = series.value_counts(dropna=False)
+            counts = counts[counts > 0]  # unused categories
+            stats["unique"], stats["top_error"] = len(counts), 0
+        stats["top"] = counts.head(PROFILE_TOP_K)
+    return stats
+
+
+@shared_result("profiles", spinner="Profiling columns...", max_entries=16)
+def profile_dataset(_frame, dataset_version):
+    """Profile every column in one column-parallel pass.
+
+    Replaces the separate describe/isnull/value_counts scans; all tabs read from it.
+    """
+    with ThreadPoolExecutor(PROFILE_WORKERS) as pool:
+        stats = dict(zip(_frame.columns, pool.map(_profile_column, [_frame[col] for col in _frame.columns])))
+    columns = pd.DataFrame({
+        col: {k: v for k, v in col_stats.items() if k not in ("top", "top_error")} for col, col_stats in stats.items()
+    }).T
+    numeric_cols = [col for col, col_stats in stats.items() if col_stats["kind"] == "numeric"]
+    row_count = len(_frame)
+    return {
+        "row_count": row_count,
+        "columns": columns,
+        "numeric_cols": numeric_cols,
+        "categorical_cols": [col for col, col_stats in stats.items() if col_stats["kind"] == "categorical"],
+        "describe": columns.reindex(index=numeric_cols, columns=DESCRIBE_STATS).T.astype("float64"),
+        "missing_percent": (columns["nulls"].astype("float64") / max(row_count, 1)) * 100,
+        "top_values": {col: col_stats["top"] for col, col_stats in stats.items() if col_stats["top"] is not None},
+        # Upper bound on how far each top-value count may undercount; 0 when counted exactly
+        "top_errors": {col: col_stats["top_error"] for col, col_stats in stats.items() if col_stats["top"] is not None},
+    }
+
+
+def insight_lines(top_values, top_error, row_count):
+    """How common each top value is, as a range when the counts are approximate."""
+    if top_error:
+        # The true share lies between the estimate and estimate + error
+        return [
+            f"{value}: {count / row_count * 100:.1f}–{min(count + top_error, row_count) / row_count * 100:.1f}%"
+            for value, count in top_values.items()
+        ] + [f"≈ approximate, true counts up to {top_error:,} rows higher"]
+    top_count = top_values.iloc[0]
+    return [f"{top_count / row_count * 100:.1f}% of total ({top_count}/{row_count})"] + [
+        f"{value}: {count / row_count * 100:.1f}%" for value, count in top_values.iloc[1:].items()
+    ]
+
+
+# --- Chart Downsampling ---
+DEFAULT_POINT_BUDGET = 5_000
+
+
+def _axis_positions(series):
+    """Numeric x positions: numbers as-is, datetimes as epoch nanoseconds, anything else by row order."""
+    if series.dtype.kind == "M":
+        return pd.DatetimeIndex(series).asi8.astype("float64")
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype="float64", na_value=np.nan)
+    return np.arange(len(series), dtype="float64")
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: pick n_out points of a line (x sorted) that keep its visual shape."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        # Twice the triangle area between the anchor, each candidate and the next bucket's average
+        area = np.abs(
+            (x[anchor] - avg_x) * (y[start:end] - y[anchor]) - (x[anchor] - x[start:end]) * (avg_y - y[anchor])
+        )
+        anchor = start + int(np.argmax(area))
+        selected[i + 1] = anchor
+    return selected
+
+
+def minmax_indices(x, y, n_out):
+    """Keep the lowest and highest y in each of n_out / 2 equal-width x buckets."""
+    n_buckets = max(n_out // 2, 1)
+    if len(x) <= n_out:
+        return np.arange(len(x))
+    edges = np.linspace(x.min(), x.max(), n_buckets + 1)
+    buckets = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, n_buckets - 1)
+    grouped = pd.Series(y).groupby(buckets)
+    return np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+
+
+# A group_by series needs at least this many points of the budget to be downsampled on its own
+MIN_SERIES_POINTS = 3
+
+
+def downsample_for_chart(frame, x, y, group_by, budget, method):
+    """Reduce the rows behind a Line (LTTB) or Scatter (min-max) chart to roughly `budget` points.
+
+    Each group_by series is downsampled separately with a share of the budget proportional to
+    its size; groups too small for a share of MIN_SERIES_POINTS are pooled and downsampled as
+    one series, so the budget holds however many groups there are. Returns the rows to plot
+    and the number of plottable rows they were taken from.
+    """
+    columns = list(dict.fromkeys(col for col in (x, y, group_by) if col))
+    data = frame[columns].dropna(subset=list(dict.fromkeys([x, y])))
+    if len(data) <= budget:
+        return data, len(data)
+    if group_by:
+        groups = list(data.groupby(group_by, sort=False, observed=True, dropna=False).indices.values())
+    else:
+        groups = [np.arange(len(data))]
+    shares = [budget * len(positions) / len(data) for positions in groups]
+    series = [(positions, int(share)) for positions, share in zip(groups, shares) if share >= MIN_SERIES_POINTS]
+    small = [(positions, share) for positions, share in zip(groups, shares) if share < MIN_SERIES_POINTS]
+    if small:
+        pooled = np.sort(np.concatenate([positions for positions, _ in small]))
+        series.append((pooled, max(int(sum(share for _, share in small)), MIN_SERIES_POINTS)))
+    keep = []
+    for positions, part_budget in series:
+        xs = _axis_positions(data[x].iloc[positions])
+        ys = data[y].iloc[positions].to_numpy(dtype="float64", na_value=np.nan)
+        if method == "lttb":
+            order = np.argsort(xs, kind="stable")
+            keep.append(positions[order[lttb_indices(xs[order], ys[order], part_budget)]])
+        else:
+            keep.append(positions[minmax_indices(xs, ys, part_budget)])
+    return data.iloc[np.concatenate(keep)], len(data)
+
+
+# --- Render Backend Selection ---
+RENDER_BACKENDS = ["Auto", "SVG", "WebGL", "Density"]
+# Auto switches to WebGL (scattergl) once this many points are drawn...
+WEBGL_MIN_POINTS = int(os.environ.get("CSV_BOT_WEBGL_POINTS", "10000"))
+# ...and scatter plots to a server-side density heatmap once the data has this many rows
+DENSITY_MIN_POINTS = int(os.environ.get("CSV_BOT_DENSITY_POINTS", "500000"))
+DENSITY_BINS = 200
+
+
+def density_grid(frame, x, y, bins=DENSITY_BINS):
+    """2D histogram of every (x, y) pair: counts plus the x and y bin centers."""
+    data = frame[list(dict.fromkeys([x, y]))].dropna()
+    xs = _axis_positions(data[x])
+    ys = data[y].to_numpy(dtype="float64", na_value=np.nan)
+    counts, x_edges, y_edges = np.histogram2d(xs, ys, bins=bins)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    if data[x].dtype.kind == "M":
+        x_centers = pd.to_datetime(x_centers.astype("int64"))
+    return counts, x_centers, (y_edges[:-1] + y_edges[1:]) / 2
+
+
+def density_figure(grid, x, y, color_seq):
+    """Server-side 2D histogram sent as a single heatmap trace."""
+    counts, x_centers, y_centers = grid
+    fig = go.Figure(go.Heatmap(
+        x=x_centers, y=y_centers,
+        # Empty cells stay transparent so the theme background shows through
+        z=np.where(counts > 0, counts, np.nan).T,
+        colorscale=theme_colorscale(color_seq),
+        colorbar=dict(title="rows"),
+    ))
+    fig.update_layout(xaxis_title=x, yaxis_title=y)
+    return fig
+
+
+# --- Chart Pre-aggregation ---
+DEFAULT_HISTOGRAM_BINS = 50
+# Outlier points drawn per box; the rest are summarised by the whiskers
+BOX_MAX_OUTLIERS = 200
+BAR_AGGREGATIONS = {"Sum": "sum", "Mean": "mean"}
+
+
+def _series_keys(x, y, group_by):
+    """Group-by keys for an aggregated chart: x plus group_by when it is a separate column."""
+    return [x] + ([group_by] if group_by and group_by not in (x, y) else [])
+
+
+def value_column(x, y):
+    """Column holding the aggregated y; renamed when y is also the x axis, so both fit in one frame."""
+    return f"{y} (value)" if y == x else y
+
+
+def aggregate_bar(frame, x, y, group_by, agg):
+    """One row per (x, group) with the summed or averaged y, instead of one bar segment per row."""
+    keys = _series_keys(x, y, group_by)
+    return frame.groupby(keys, observed=True, sort=True)[y].agg(agg).rename(value_column(x, y)).reset_index()
+
+
+def aggregate_histogram(frame, x, y, group_by, bins):
+    """Sum of y per x bin (per category for text x) and group, like px.histogram's histfunc="sum".
+
+    Returns the binned frame and the bar widths (None for categorical x).
+    """
+    keys = _series_keys(x, y, group_by)
+    data = frame[list(dict.fromkeys(keys + [y]))].dropna(subset=[x, y])
+    xs = data[x]
+    if not (xs.dtype.kind == "M" or (pd.api.types.is_numeric_dtype(xs) and not pd.api.types.is_bool_dtype(xs))):
+        return data.groupby(keys, observed=True, sort=True)[y].sum().rename(value_column(x, y)).reset_index(), None
+
+    positions = _axis_positions(xs)
+    weights = data[y].to_numpy(dtype="float64", na_value=np.nan)
+    edges = np.histogram_bin_edges(positions, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    widths = np.diff(edges)
+    if xs.dtype.kind == "M":
+        centers = pd.to_datetime(centers.astype("int64"))
+        widths = widths / 1e6  # plotly measures date-axis widths in milliseconds
+    groups = data.groupby(keys[1:], observed=True, sort=True).indices if len(keys) > 1 else {None: slice(None)}
+    parts = []
+    for name, idx in groups.items():
+        sums, _ = np.histogram(positions[idx], bins=edges, weights=weights[idx])
+        part = pd.DataFrame({x: centers, value_column(x, y): sums})
+        if len(keys) > 1:
+            part[keys[1]] = name
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True), widths
+
+
+def box_summaries(frame, x, y, group_by):
+    """Five-number summary per (x, group) with Tukey whiskers, plus a sample of the outliers."""
+    keys = _series_keys(x, y, group_by)
+    value = value_column(x, y)
+    data = frame[keys].assign(**{value: frame[y]}).dropna()
+    grouped = data.groupby(keys, observed=True, sort=True)[value]
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "median", "q3"]
+    iqr = stats["q3"] - stats["q1"]
+    bounds = pd.DataFrame({"low": stats["q1"] - 1.5 * iqr, "high": stats["q3"] + 1.5 * iqr})
+    joined = data.join(bounds, on=keys)
+    inside = joined[value].between(joined["low"], joined["high"])
+    fences = joined[inside].groupby(keys, observed=True, sort=True)[value].agg(["min", "max"])
+    stats["lowerfence"] = fences["min"]
+    stats["upperfence"] = fences["max"]
+    outliers = joined.loc[~inside, keys + [value]].sample(frac=1, random_state=0)
+    outliers = outliers.groupby(keys, observed=True).head(BOX_MAX_OUTLIERS)
+    return stats.reset_index(), outliers
+
+
+def box_figure(stats, outliers, x, y, group_by, color_seq):
+    keys = _series_keys(x, y, group_by)
+    fig = go.Figure()
+    groups = stats.groupby(keys[1], sort=False, observed=True) if len(keys) > 1 else [(None, stats)]
+    for i, (name, part) in enumerate(groups):
+        color = color_seq[i % len(color_seq)]
+        label = str(name) if name is not None else y
+        fig.add_trace(go.Box(
+            x=part[x], q1=part["q1"], median=part["median"], q3=part["q3"],
+            lowerfence=part["lowerfence"], upperfence=part["upperfence"],
+            name=label, legendgroup=label, offsetgroup=label, marker_color=color, boxpoints=False,
+        ))
+        points = outliers if name is None else outliers[outliers[keys[1]] == name]
+        fig.add_trace(go.Scatter(
+            x=points[x], y=points[value_column(x, y)], mode="markers", name=label, legendgroup=label, offsetgroup=label,
+            showlegend=False, marker=dict(color=color, size=5),
+        ))
+    fig.update_layout(boxmode="group", scattermode="group", xaxis_title=x, yaxis_title=y)
+    return fig
+
+
+# --- Figure Cache ---
+FIGURE_CACHE_ENTRIES = 32
+# Figures are built once in this theme's colours and restyled for whichever theme is selected
+BASE_THEME = "Vibrant"
+
+
+def theme_colorscale(colors):
+    return [[i / (len(colors) - 1), color] for i, color in enumerate(colors)]
+
+
+@shared_result("correlations", max_entries=8)
+def correlation_matrix(_frame, dataset_version, columns):
+    return _frame[list(columns)].corr()
+
+
+@shared_result("charts", spinner="Building chart...", max_entries=FIGURE_CACHE_ENTRIES)
+def build_figure(_backend, dataset_version, graph_type, x, y, group_by, options):
+    """Build a figure in the base theme, cached per dataset version and graph parameters.
+
+    `options` holds the graph-type specific settings as (name, value) pairs. Returns the
+    figure and how it was rendered: backend plus source and plotted point counts.
+    """
+    opts = dict(options)
+    color_seq = PLOTLY_THEMES[BASE_THEME]["colors"]
+    plot_df, source_points = None, _backend.row_count
+    render_backend = None
+    if graph_type in ("Line", "Scatter"):
+        source_points = _backend.plottable_rows(x, y)
+        render_backend = opts["render_choice"]
+        # A density heatmap can't show groups, so Auto only picks it for ungrouped scatter plots
+        if render_backend == "Auto" and graph_type == "Scatter" and not group_by \
+                and source_points >= opts["density_min_points"]:
+            render_backend = "Density"
+        if render_backend != "Density":
+            plot_df, source_points = _backend.chart_points(
+                x, y, group_by, None if opts["full_resolution"] else opts["point_budget"],
+                "lttb" if graph_type == "Line" else "minmax",
+            )
+            if render_backend == "Auto":
+                render_backend = "WebGL" if len(plot_df) >= opts["webgl_min_points"] else "SVG"
+    render_mode = "webgl" if render_backend == "WebGL" else "svg"
+
+    if graph_type == "Line":
+        fig = px.line(plot_df, x=x, y=y, color=group_by, color_discrete_sequence=color_seq, render_mode=render_mode)
+    elif graph_type == "Bar":
+        plot_df = _backend.bar_data(x, y, group_by, opts["bar_agg"])
+        color_key = _series_keys(x, y, group_by)[1:]
+        fig = px.bar(
+            plot_df, x=x, y=value_column(x, y), color=color_key[0] if color_key else None,
+            color_discrete_sequence=color_seq, labels={value_column(x, y): f"{opts['bar_agg']} of {y}"},
+            barmode="relative" if opts["bar_agg"] == "sum" else "group",
+        )
+    elif graph_type == "Scatter" and render_backend == "Density":
+        fig = density_figure(_backend.density_data(x, y), x, y, color_seq)
+    elif graph_type == "Scatter":
+        fig = px.scatter(plot_df, x=x, y=y, color=group_by, color_discrete_sequence=color_seq, render_mode=render_mode)
+    elif graph_type == "Box":
+        box_stats, box_outliers = _backend.box_data(x, y, group_by)
+        fig = box_figure(box_stats, box_outliers, x, y, group_by, color_seq)
+    elif graph_type == "Histogram":
+        plot_df, bar_widths = _backend.histogram_data(x, y, group_by, opts["bins"])
+        color_key = _series_keys(x, y, group_by)[1:]
+        fig = px.bar(
+            plot_df, x=x, y=value_column(x, y), color=color_key[0] if color_key else None,
+            color_discrete_sequence=color_seq, labels={value_column(x, y): f"sum of {y}"},
+        )
+        if bar_widths is not None:
+            fig.update_traces(width=bar_widths)
+            fig.update_layout(bargap=0)
+    elif graph_type == "Heatmap":
+        fig = px.imshow(_backend.correlation(opts["columns"]), color_continuous_scale=color_seq)
+    else:
+        raise ValueError(f"Unknown graph type: {graph_type}")
+    return fig, {"render_backend": render_backend, "source_points": source_points, "plotted_points": source_points if plot_df is None else len(plot_df)}
+
+
+def apply_theme(fig, theme):
+    """Restyle a cached figure for a colour theme; traces are copied, never recomputed."""
+    themed = go.Figure(fig)
+    colors = theme["colors"]
+    # One colour per legend group, in the order the groups were drawn
+    groups = list(dict.fromkeys(trace.legendgroup or trace.name or "" for trace in themed.data))
+    for trace in themed.data:
+        color = colors[groups.index(trace.legendgroup or trace.name or "") % len(colors)]
+        if trace.type == "heatmap":
+            trace.colorscale = theme_colorscale(colors)
+        elif trace.type in ("scatter", "scattergl") and "lines" in (trace.mode or ""):
+            trace.line.color = color
+        else:
+            trace.marker.color = color
+    themed.update_coloraxes(colorscale=theme_colorscale(colors))
+    themed.update_layout(**{**custom_plotly_layout, "paper_bgcolor": theme["bg"], "plot_bgcolor": theme["bg"]})
+    return themed
+
+
+# --- Data Preview Window ---
+PREVIEW_PAGE_SIZES = [50, 100, 250, 500]
+# Out-of-core preview rows are fetched in aligned blocks of this many and kept in the query
+# cache, so paging nearby re-slices a block instead of re-running the scan; never drawn as-is
+PREVIEW_FETCH_BLOCK_ROWS = 1_000
+
+
+@shared_result("sorts", spinner="Sorting...", max_entries=32)
+def sort_positions(_frame, dataset_version, column, ascending):
+    """Row positions of the frame ordered by one column (stable, missing values last)."""
+    ordered = _frame[column].reset_index(drop=True).sort_values(ascending=ascending, kind="stable", na_position="last")
+    return ordered.index.to_numpy()
+
+
+@shared_result("filters", spinner="Filtering...", max_entries=32)
+def filter_mask(_frame, dataset_version, column, query):
+    """Boolean mask of rows whose value in `column` contains `query` (case-insensitive)."""
+    series = _frame[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Match each category once, then map the result through the codes
+        matched = series.cat.categories.astype(str).str.contains(query, case=False, regex=False)
+        codes = series.cat.codes.to_numpy()
+        return np.append(matched, False)[codes]  # code -1 (missing) hits the trailing False
+    return series.astype(str).str.contains(query, case=False, regex=False).to_numpy() & series.notna().to_numpy()
+
+
+def preview_positions(frame, dataset_version, sort_by=None, ascending=True, filter_column=None, query=""):
+    """Row positions for the preview after the cached sort and filter are applied."""
+    if sort_by:
+        positions = sort_positions(frame, dataset_version, sort_by, ascending)
+    else:
+        positions = np.arange(len(frame))
+    if filter_column and query:
+        positions = positions[filter_mask(frame, dataset_version, filter_column, query)[positions]]
+    return positions
+
+
+def preview_window(frame, positions, start, page_size, columns=None):
+    """Exactly one preview page.
+
+    Only this slice is handed to st.dataframe, so serialization cost stays flat with file size.
+    """
+    return frame.iloc[positions[start:start + page_size]][columns or frame.columns]
+
+
+# --- Analysis Backends ---
+# The tabs only talk to a backend: PandasBackend answers from the in-memory frame, DuckDBBackend
+# runs the same questions as SQL over the file on disk for data that doesn't fit in memory.
+ANALYSIS_BACKENDS = {"In-memory (pandas)": "pandas", "Out-of-core (DuckDB)": "duckdb"}
+DUCKDB_MEMORY_LIMIT = os.environ.get("CSV_BOT_DUCKDB_MEMORY", "1GB")
+# Most points a chart pulls out of DuckDB, even at full resolution; larger results are min-max bucketed in SQL
+DUCKDB_MAX_CHART_POINTS = int(os.environ.get("CSV_BOT_DUCKDB_CHART_POINTS", "500000"))
+# Uploads are written here for DuckDB to scan, along with its spill files and CSV exports
+DUCKDB_WORK_DIR = os.path.join(INGEST_SPILL_DIR or tempfile.gettempdir(), "csv-bot-duckdb")
+# Files under this directory can be opened without uploading them (out-of-core backend only)
+SERVER_DATA_DIR = os.environ.get("CSV_BOT_DATA_DIR")
+SERVER_FILE_TYPES = (".csv", ".tsv", ".gz", ".zst", ".parquet")
+SQL_NUMERIC_TYPES = (
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT",
+    "UHUGEINT", "FLOAT", "DOUBLE", "DECIMAL",
+)
+SQL_DATETIME_TYPES = ("DATE", "TIMESTAMP")
+
+
+class PandasBackend:
+    """Tab queries answered from the cleaned in-memory DataFrame."""
+
+    out_of_core = False
+
+    def __init__(self, frame, dataset_hash, ops):
+        self.frame = frame
+        self.dataset_hash = dataset_hash
+        self.ops = ops
+        self.version = f"{dataset_hash}-{ops_digest(ops)}" if ops else dataset_hash
+        self.columns = frame.columns.tolist()
+        self.row_count = len(frame)
+
+    def column_kinds(self):
+        kinds = {col: column_kind(dtype) for col, dtype in self.frame.dtypes.items()}
+        return [col for col, kind in kinds.items() if kind == "numeric"], [col for col, kind in kinds.items() if kind == "categorical"]
+
+    def profile(self):
+        return profile_dataset(self.frame, self.version)
+
+    def missing_counts(self):
+        return self.frame.isna().sum()
+
+    def duplicate_count(self, columns=None):
+        return duplicate_index(self.frame, self.dataset_hash, self.ops, columns).duplicate_count
+
+    def sample(self, n, seed):
+        return self.frame.sample(n, random_state=seed) if len(self.frame) > n else self.frame
+
+    def stratified_sample(self, column, n, seed):
+        if column is None or len(self.frame) <= n:
+            return self.sample(n, seed)
+        codes, _ = pd.factorize(self.frame[column], use_na_sentinel=False)
+        sizes = np.bincount(codes)
+        quotas = np.asarray(stratum_quotas(sizes, n))
+        # Rows ordered by stratum, randomly within each; a row is drawn if its rank is inside its stratum's quota
+        order = np.lexsort((np.random.default_rng(seed).random(len(codes)), codes))
+        ranks = np.arange(len(order)) - (np.cumsum(sizes) - sizes)[codes[order]]
+        return self.frame.iloc[np.sort(order[ranks < quotas[codes[order]]])]
+
+    def with_clusters(self, clustering):
+        clustered = copy.copy(self)
+        # A shallow copy shares every existing column with the cached frame
+        clustered.frame = self.frame.copy(deep=False)
+        clustered.frame[clustering["column"]] = clustering["labels"]
+        clustered.columns = self.columns + [clustering["column"]]
+        clustered.version = f"{self.version}-{clustering['digest']}"
+        return clustered
+
+    def preview_rows(self, filter_column=None, query=""):
+        return len(preview_positions(self.frame, self.version, None, True, filter_column, query))
+
+    def preview_page(self, start, page_size, sort_by=None, ascending=True, filter_column=None, query="", columns=None):
+        positions = preview_positions(self.frame, self.version, sort_by, ascending, filter_column, query)
+        return preview_window(self.frame, positions, start, page_size, columns)
+
+    def plottable_rows(self, x, y):
+        return len(self.frame) - int(self.frame[[x, y]].isna().any(axis=1).sum())
+
+    def chart_points(self, x, y, group_by, budget, method):
+        if budget is None:
+            return self.frame, self.plottable_rows(x, y)
+        return downsample_for_chart(self.frame, x, y, group_by, budget, method)
+
+    def bar_data(self, x, y, group_by, agg):
+        return aggregate_bar(self.frame, x, y, group_by, agg)
+
+    def histogram_data(self, x, y, group_by, bins):
+        return aggregate_histogram(self.frame, x, y, group_by, bins)
+
+    def box_data(self, x, y, group_by):
+        return box_summaries(self.frame, x, y, group_by)
+
+    def correlation(self, columns):
+        return correlation_matrix(self.frame, self.version, tuple(columns))
+
+    def density_data(self, x, y, bins=DENSITY_BINS):
+        return density_grid(self.frame, x, y, bins)
+
+    def datetime_columns(self):
+        return list(detect_datetime_columns(self.frame, self.version)[0])
+
+    def datetime_note(self, dt_col):
+        return detect_datetime_columns(self.frame, self.version)[1].get(dt_col)
+
+    def time_span(self, dt_col):
+        index, _ = sorted_time_index(self.frame, self.version, dt_col)
+        return (index[0], index[-1]) if len(index) else None
+
+    def time_series(self, dt_col, columns, how="Mean", finest=None, window=None):
+        """Columns aggregated into time buckets over `window` (default: everything); returns (series, frequency).
+
+        The sorted index turns the window into a slice, so only the visible rows are aggregated.
+        """
+        index, positions = sorted_time_index(self.frame, self.version, dt_col)
+        lo, hi = (0, len(index)) if window is None else (
+            index.searchsorted(pd.Timestamp(window[0]), "left"), index.searchsorted(pd.Timestamp(window[1]), "right")
+        )
+        if lo >= hi:
+            return pd.DataFrame(columns=columns), finest or next(iter(TIME_SERIES_FREQUENCIES))
+        freq = pick_frequency(index[lo], index[hi - 1], finest, rows=hi - lo)
+        rows = self.frame[columns].take(positions[lo:hi]).set_index(index[lo:hi])
+        buckets = rows.resample(TIME_SERIES_FREQUENCIES[freq][0], closed="left", label="left")
+        return buckets.agg(TIME_SERIES_AGGREGATIONS[how][0]), freq
+
+    def export(self, target, fmt):
+        kind, compression = EXPORT_FORMATS[fmt][:2]
+        if kind == "parquet":
+            self.frame.to_parquet(target, index=False)
+        elif kind == "feather":
+            feather.write_feather(pa.Table.from_pandas(self.frame, preserve_index=False), target)
+        else:
+            self.frame.to_csv(target, index=False, chunksize=EXPORT_CHUNK_ROWS, compression=compression)
+
+
+def _sql_ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+@st.cache_resource
+def get_duckdb():
+    return duckdb.connect(config={
+        "memory_limit": DUCKDB_MEMORY_LIMIT,
+        "temp_directory": os.path.join(duckdb_work_dir(), "spill"),
+    })
+
+
+@shared_result("queries", max_entries=256)
+def duckdb_query(sql, params=()):
+    """Run a query on its own cursor and return the (small) result as a DataFrame.
+
+    Results are cached by SQL text; view names embed the dataset version, so a new version
+    never hits an old result.
+    """
+    cursor = get_duckdb().cursor()
+    try:
+        return cursor.execute(sql, list(params)).df()
+    finally:
+        cursor.close()
+
+
+def duckdb_source_sql(path):
+    """Table function that scans a CSV/TSV (plain, gzip or zstd) or Parquet file in place."""
+    with open(path, "rb") as f:
+        sniffed = sniff_upload(f.read(SNIFF_BYTES), os.path.basename(path))
+    if sniffed["format"] == "parquet":
+        return f"read_parquet({_sql_literal(path)})", sniffed
+    if sniffed["compression"] not in (None, "gzip", "zstd"):
+        raise ValueError(f"{sniffed['compression']} files can't be read out-of-core; use gzip, zstd or plain CSV")
+    encoding = "utf-8" if sniffed["encoding"] == "utf-8-sig" else sniffed["encoding"]
+    return (
+        f"read_csv({_sql_literal(path)}, delim={_sql_literal(sniffed['sep'])}, "
+        f"encoding={_sql_literal(encoding)}, compression={_sql_literal(sniffed['compression'] or 'none')})"
+    ), sniffed
+
+
+def duckdb_sources_sql(sources):
+    """Several (path, file name) parts as one relation, columns matched by name with promoted types."""
+    scans = [(duckdb_source_sql(path), name) for path, name in sources]
+    column = source_file_column({col for (source_sql, _), _ in scans for col in duckdb_columns(source_sql)})
+    parts = [f"SELECT *, {_sql_literal(name)} AS {_sql_ident(column)} FROM {source_sql}" for (source_sql, _), name in scans]
+    return "(" + " UNION ALL BY NAME ".join(parts) + ")", scans[0][0][1]
+
+
+@st.cache_resource
+def duckdb_work_dir():
+    """DUCKDB_WORK_DIR, cleared once per process of uploads an earlier process left behind."""
+    os.makedirs(DUCKDB_WORK_DIR, exist_ok=True)
+    for name in os.listdir(DUCKDB_WORK_DIR):
+        path = os.path.join(DUCKDB_WORK_DIR, name)
+        if name.startswith("parse-"):
+            shutil.rmtree(path, ignore_errors=True)
+        elif name.startswith("upload-"):
+            remove_files([path])
+    return DUCKDB_WORK_DIR
+
+
+def spill_upload(uploaded_file, directory=None):
+    """Write an upload to disk once so DuckDB can scan it; returns the path and content hash."""
+    digest = upload_digest(uploaded_file)
+    path = os.path.join(directory or duckdb_work_dir(), f"upload-{digest}")
+    if not os.path.exists(path):
+        with open(path + ".part", "wb") as f:
+            f.write(uploaded_file.getbuffer())
+        os.replace(path + ".part", path)
+    return path, digest
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def list_server_files():
+    if not SERVER_DATA_DIR or not os.path.isdir(SERVER_DATA_DIR):
+        return []
+    return sorted(name for name in os.listdir(SERVER_DATA_DIR) if name.lower().endswith(SERVER_FILE_TYPES))
+
+
+def server_source(name):
+    """Path and version hash (path, size, mtime) of a file in SERVER_DATA_DIR."""
+    root = os.path.realpath(SERVER_DATA_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.dirname(path) != root:
+        raise ValueError(f"{name} is not in the server data directory")
+    stat = os.stat(path)
+    digest = hashlib.blake2b(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode(), digest_size=16).hexdigest()
+    return path, digest
+
+
+def cleaning_sql(op, relation, types):
+    """SELECT over `relation` that applies one cleaning step, mirroring apply_cleaning_op."""
+    if op["op"] == "dropna":
+        return f"SELECT * FROM {relation} WHERE {_sql_ident(op['column'])} IS NOT NULL"
+    if op["op"] in ("fillna", "impute"):
+        if op["strategy"] in MODEL_IMPUTERS:
+            raise ValueError("KNN and iterative imputation need the pandas backend")
+        columns = [col for col in filled_columns(op) if op["strategy"] == "mode" or types[col].startswith(SQL_NUMERIC_TYPES)]
+        if not columns:
+            return f"SELECT * FROM {relation}"
+        # Every fill value comes from one aggregate scan, then one pass fills all the columns
+        fills = ", ".join(f"{op['strategy']}({_sql_ident(col)}) AS {_sql_ident(col)}" for col in columns)
+        replaced = ", ".join(
+            f"coalesce({relation}.{_sql_ident(col)}, CAST(__fill.{_sql_ident(col)} AS {types[col]})) AS {_sql_ident(col)}"
+            for col in columns
+        )
+        return f"SELECT {relation}.* REPLACE ({replaced}) FROM {relation} CROSS JOIN (SELECT {fills} FROM {relation}) AS __fill"
+    if op["op"] == "drop_duplicates" and op.get("columns"):
+        # Row order is not kept out-of-core; which of the duplicates survives is arbitrary
+        return f"SELECT DISTINCT ON ({', '.join(map(_sql_ident, op['columns']))}) * FROM {relation}"
+    if op["op"] == "drop_duplicates":
+        return f"SELECT DISTINCT * FROM {relation}"
+    raise ValueError(f"Unknown cleaning step: {op['op']}")
+
+
+def duckdb_columns(relation):
+    schema = duckdb_query(f"DESCRIBE SELECT * FROM {relation}")
+    return dict(zip(schema["column_name"], schema["column_type"]))
+
+
+class DuckDBBackend:
+    """The same tab queries as SQL over the file on disk.
+
+    Every cleaning step becomes a view over the previous one, DuckDB streams the file and
+    spills to DUCKDB_WORK_DIR past DUCKDB_MEMORY_LIMIT, and only small results (pages,
+    aggregates, summaries) become DataFrames.
+    """
+
+    out_of_core = True
+
+    def __init__(self, path, dataset_hash, ops):
+        """`path` is one file, or a list of (path, file name) parts to read as one dataset."""
+        self.path = path
+        self.dataset_hash = dataset_hash
+        self.ops = ops
+        self.version = f"duckdb-{dataset_hash}" + (f"-{ops_digest(ops)}" if ops else "")
+        source_sql, self.sniffed = duckdb_sources_sql(path) if isinstance(path, list) else duckdb_source_sql(path)
+        cursor = get_duckdb().cursor()
+        try:
+            relation = _sql_ident(f"src_{dataset_hash}")
+            cursor.execute(f"CREATE VIEW IF NOT EXISTS {relation} AS SELECT * FROM {source_sql}")
+            self.source_columns = list(duckdb_columns(relation))
+            for end in range(1, len(ops) + 1):
+                step = _sql_ident(f"step_{dataset_hash}_{ops_digest(ops[:end])}")
+                cursor.execute(f"CREATE VIEW IF NOT EXISTS {step} AS {cleaning_sql(ops[end - 1], relation, duckdb_columns(relation))}")
+                relation = step
+        finally:
+            cursor.close()
+        self.relation = relation
+        self.types = duckdb_columns(relation)
+        self.columns = list(self.types)
+        self.row_count = int(self.scalar(f"SELECT count(*) FROM {relation}"))
+
+    def scalar(self, sql, params=()):
+        return duckdb_query(sql, params).iloc[0, 0]
+
+    def _position_sql(self, column):
+        """Numeric axis position: numbers as-is, dates as epoch seconds, anything else by row order."""
+        if self.types[column].startswith(SQL_DATETIME_TYPES):
+            return f"epoch({_sql_ident(column)})"
+        if self.types[column].startswith(SQL_NUMERIC_TYPES):
+            return f"CAST({_sql_ident(column)} AS DOUBLE)"
+        return "CAST(row_number() OVER () AS DOUBLE)"
+
+    def _from_positions(self, column, values):
+        return pd.to_datetime(values, unit="s") if self.types[column].startswith(SQL_DATETIME_TYPES) else values
+
+    def _not_null(self, *columns):
+        return " AND ".join(f"{_sql_ident(col)} IS NOT NULL" for col in dict.fromkeys(columns))
+
+    def column_kinds(self):
+        return (
+            [col for col, sql_type in self.types.items() if sql_type.startswith(SQL_NUMERIC_TYPES)],
+            [col for col, sql_type in self.types.items() if sql_type == "VARCHAR"],
+        )
+
+    def profile(self):
+        return duckdb_profile(self, self.version)
+
+    def missing_counts(self):
+        nulls = duckdb_query(
+            "SELECT " + ", ".join(f"count(*) - count({_sql_ident(col)})" for col in self.columns) + f" FROM {self.relation}"
+        ).iloc[0]
+        return pd.Series(nulls.to_numpy(), index=self.columns)
+
+    def duplicate_count(self, columns=None):
+        subset = ", ".join(map(_sql_ident, columns or self.columns))
+        return int(self.row_count - self.scalar(f"SELECT count(*) FROM (SELECT DISTINCT {subset} FROM {self.relation})"))
+
+    def sample(self, n, seed):
+        return duckdb_query(f"SELECT * FROM {self.relation} USING SAMPLE reservoir({int(n)} ROWS) REPEATABLE ({int(seed)})")
+
+    def stratified_sample(self, column, n, seed):
+        if column is None or self.row_count <= n:
+            return self.sample(n, seed)
+        sizes = duckdb_query(f"SELECT {_sql_ident(column)} AS stratum, count(*) AS size FROM {self.relation} GROUP BY ALL")
+        quotas = ", ".join(
+            f"({_sql_literal(stratum) if not pd.isna(stratum) else 'NULL'}, {quota})"
+            for stratum, quota in zip(sizes["stratum"], stratum_quotas(sizes["size"].tolist(), n))
+        )
+        # Rows are shuffled by a seeded hash of their values, so the same seed draws the same sample
+        return duckdb_query(
+            f"SELECT * EXCLUDE (__key, __rank, __stratum, __quota) FROM ("
+            f"SELECT *, row_number() OVER (PARTITION BY {_sql_ident(column)} ORDER BY __key) AS __rank "
+            f"FROM (SELECT *, hash(__row, {int(seed)}) AS __key FROM {self.relation} AS __row)) "
+            f"JOIN (VALUES {quotas}) q(__stratum, __quota) "
+            f"ON {_sql_ident(column)} IS NOT DISTINCT FROM __stratum WHERE __rank <= __quota ORDER BY __key"
+        )
+
+    def with_clusters(self, clustering):
+        """This backend plus a cluster column, assigned in SQL to the nearest centroid."""
+        clustered = copy.copy(self)
+        distances = ", ".join(
+            " + ".join(
+                f"pow((coalesce(CAST({_sql_ident(col)} AS DOUBLE), {mean!r}) - {mean!r}) / {std!r} - {center!r}, 2)"
+                for col, mean, std, center in zip(clustering["features"], clustering["means"], clustering["stds"], centroid)
+            )
+            for centroid in clustering["centers"].tolist()
+        )
+        relation = _sql_ident(f"clusters_{self.dataset_hash}_{clustering['digest']}")
+        cursor = get_duckdb().cursor()
+        try:
+            cursor.execute(
+                f"CREATE VIEW IF NOT EXISTS {relation} AS SELECT * EXCLUDE (__d), 'Cluster ' || list_position(__d, list_min(__d)) "
+                f"AS {_sql_ident(clustering['column'])} FROM (SELECT *, [{distances}] AS __d FROM {self.relation})"
+            )
+        finally:
+            cursor.close()
+        clustered.relation = relation
+        clustered.types = {**self.types, clustering["column"]: "VARCHAR"}
+        clustered.columns = self.columns + [clustering["column"]]
+        clustered.version = f"{self.version}-{clustering['digest']}"
+        return clustered
+
+    def _preview_filter(self, filter_column, query):
+        if filter_column and query:
+            return f"WHERE contains(lower(CAST({_sql_ident(filter_column)} AS VARCHAR)), lower(?))", (query,)
+        return "", ()
+
+    def preview_rows(self, filter_column=None, query=""):
+        where, params = self._preview_filter(filter_column, query)
+        return int(self.scalar(f"SELECT count(*) FROM {self.relation} {where}", params))
+
+    def preview_page(self, start, page_size, sort_by=None, ascending=True, filter_column=None, query="", columns=None):
+        where, params = self._preview_filter(filter_column, query)
+        order = f"ORDER BY {_sql_ident(sort_by)} {'ASC' if ascending else 'DESC'} NULLS LAST" if sort_by else ""
+        selected = ", ".join(map(_sql_ident, columns or self.columns))
+        first = start // PREVIEW_FETCH_BLOCK_ROWS * PREVIEW_FETCH_BLOCK_ROWS
+        blocks = [
+            duckdb_query(
+                f"SELECT {selected} FROM {self.relation} {where} {order} "
+                f"LIMIT {PREVIEW_FETCH_BLOCK_ROWS} OFFSET {offset}", params
+            )
+            for offset in range(first, start + page_size, PREVIEW_FETCH_BLOCK_ROWS)
+        ]
+        rows = pd.concat(blocks, ignore_index=True) if len(blocks) > 1 else blocks[0]
+        return rows.iloc[start - first:start - first + page_size].reset_index(drop=True)
+
+    def plottable_rows(self, x, y):
+        return int(self.scalar(f"SELECT count(*) FROM {self.relation} WHERE {self._not_null(x, y)}"))
+
+    def chart_points(self, x, y, group_by, budget, method):
+        """Plottable rows, or the min and max y of equal-width x buckets once over `budget`.
+
+        Both chart types use min-max buckets here; LTTB's sequential pass doesn't map to SQL.
+        Full resolution (no budget) is still capped at DUCKDB_MAX_CHART_POINTS.
+        """
+        columns = list(dict.fromkeys(col for col in (x, y, group_by) if col))
+        source = self.plottable_rows(x, y)
+        budget = DUCKDB_MAX_CHART_POINTS if budget is None else min(budget, DUCKDB_MAX_CHART_POINTS)
+        if source <= budget:
+            selected = ", ".join(map(_sql_ident, columns))
+            return duckdb_query(f"SELECT {selected} FROM {self.relation} WHERE {self._not_null(x, y)}"), source
+        group_sql = _sql_ident(group_by) if group_by else "NULL"
+        # Missing group values form a group of their own, which count(DISTINCT ...) would skip
+        groups = int(self.scalar(f"SELECT count(*) FROM (SELECT DISTINCT {group_sql} FROM {self.relation})")) or 1
+        buckets = max(budget // (2 * groups), 1)
+        points = duckdb_query(f"""
+            WITH pts AS (
+                SELECT {_sql_ident(x)} AS x, CAST({_sql_ident(y)} AS DOUBLE) AS y, {group_sql} AS g,
+                       {self._position_sql(x)} AS pos
+                FROM {self.relation} WHERE {self._not_null(x, y)}
+            ), bounds AS (SELECT min(pos) AS lo, max(pos) AS hi FROM pts)
+            SELECT g, arg_min(x, y) AS x_lo, min(y) AS y_lo, arg_max(x, y) AS x_hi, max(y) AS y_hi, min(pos) AS pos
+            FROM (
+                SELECT pts.*, coalesce(least(floor((pos - lo) / nullif(hi - lo, 0) * {buckets}), {buckets - 1}), 0) AS bucket
+                FROM pts, bounds
+            )
+            GROUP BY g, bucket ORDER BY g, pos
+        """)
+        rows = pd.concat([
+            points[["g", "x_lo", "y_lo", "pos"]].set_axis(["g", x, y, "pos"], axis=1),
+            points[["g", "x_hi", "y_hi", "pos"]].set_axis(["g", x, y, "pos"], axis=1),
+        ]).drop_duplicates()
+        rows = rows.sort_values(["g", "pos", x], kind="stable").drop(columns="pos").reset_index(drop=True)
+        if group_by and group_by not in (x, y):
+            rows[group_by] = rows["g"]
+        return rows.drop(columns="g")[columns], source
+
+    def bar_data(self, x, y, group_by, agg):
+        keys = ", ".join(map(_sql_ident, _series_keys(x, y, group_by)))
+        func = "avg" if agg == "mean" else agg
+        return duckdb_query(
+            f"SELECT {keys}, {func}({_sql_ident(y)}) AS {_sql_ident(value_column(x, y))} FROM {self.relation} "
+            f"WHERE {self._not_null(*_series_keys(x, y, group_by))} GROUP BY ALL ORDER BY ALL"
+        )
+
+    def histogram_data(self, x, y, group_by, bins):
+        keys = _series_keys(x, y, group_by)
+        where = self._not_null(x, y)
+        if not self.types[x].startswith(SQL_NUMERIC_TYPES + SQL_DATETIME_TYPES):
+            return duckdb_query(
+                f"SELECT {', '.join(map(_sql_ident, keys))}, sum({_sql_ident(y)}) AS {_sql_ident(value_column(x, y))} "
+                f"FROM {self.relation} WHERE {where} GROUP BY ALL ORDER BY ALL"
+            ), None
+        position = self._position_sql(x)
+        lo, hi = map(float, duckdb_query(f"SELECT min({position}), max({position}) FROM {self.relation} WHERE {where}").iloc[0])
+        if lo == hi:  # same convention as np.histogram_bin_edges
+            lo, hi = lo - 0.5, hi + 0.5
+        width = (hi - lo) / bins
+        group_sql = f", {_sql_ident(keys[1])} AS g" if len(keys) > 1 else ", NULL AS g"
+        sums = duckdb_query(
+            f"SELECT least(floor(({position} - {lo!r}) / {width!r}), {bins - 1}) AS bin{group_sql}, "
+            f"sum({_sql_ident(y)}) AS total FROM {self.relation} WHERE {where} GROUP BY ALL"
+        )
+        # Full bin grid per group, like the in-memory histogram
+        grid = sums.set_index(["g", "bin"])["total"].unstack("bin").reindex(columns=range(bins)).fillna(0)
+        parts = []
+        for name, totals in grid.iterrows():
+            part = pd.DataFrame({
+                x: self._from_positions(x, lo + (np.arange(bins) + 0.5) * width), value_column(x, y): totals.to_numpy(),
+            })
+            if len(keys) > 1:
+                part[keys[1]] = name
+            parts.append(part)
+        widths = np.full(bins, width * (1000 if self.types[x].startswith(SQL_DATETIME_TYPES) else 1))
+        return pd.concat(parts, ignore_index=True), widths
+
+    def box_data(self, x, y, group_by):
+        """Approximate (t-digest) quartiles per box, so no group is held in memory."""
+        keys = _series_keys(x, y, group_by)
+        key_sql = ", ".join(map(_sql_ident, keys))
+        data = (
+            f"SELECT {key_sql}, CAST({_sql_ident(y)} AS DOUBLE) AS __y FROM {self.relation} "
+            f"WHERE {self._not_null(*keys, y)}"
+        )
+        bounds = (
+            f"SELECT {key_sql}, approx_quantile(__y, 0.25) AS q1, approx_quantile(__y, 0.5) AS median, "
+            f"approx_quantile(__y, 0.75) AS q3 FROM data GROUP BY ALL"
+        )
+        joined = f"data JOIN (SELECT *, q1 - 1.5 * (q3 - q1) AS lo, q3 + 1.5 * (q3 - q1) AS hi FROM bounds) b USING ({key_sql})"
+        stats = duckdb_query(
+            f"WITH data AS ({data}), bounds AS ({bounds}) "
+            f"SELECT {key_sql}, q1, median, q3, min(__y) FILTER (WHERE __y BETWEEN lo AND hi) AS lowerfence, "
+            f"max(__y) FILTER (WHERE __y BETWEEN lo AND hi) AS upperfence FROM {joined} GROUP BY ALL ORDER BY ALL"
+        )
+        outliers = duckdb_query(
+            f"WITH data AS ({data}), bounds AS ({bounds}) "
+            f"SELECT {key_sql}, __y AS {_sql_ident(value_column(x, y))} FROM {joined} WHERE __y NOT BETWEEN lo AND hi "
+            f"QUALIFY row_number() OVER (PARTITION BY {key_sql} ORDER BY hash(__y)) <= {BOX_MAX_OUTLIERS}"
+        )
+        return stats, outliers
+
+    def correlation(self, columns):
+        pairs = [(a, b) for i, a in enumerate(columns) for b in columns[i + 1:]]
+        values = duckdb_query(
+            "SELECT " + ", ".join(f"corr({_sql_ident(a)}, {_sql_ident(b)})" for a, b in pairs) + f" FROM {self.relation}"
+        ).iloc[0].to_numpy() if pairs else []
+        matrix = pd.DataFrame(np.eye(len(columns)), index=list(columns), columns=list(columns))
+        for (a, b), value in zip(pairs, values):
+            matrix.loc[a, b] = matrix.loc[b, a] = value
+        return matrix
+
+    def density_data(self, x, y, bins=DENSITY_BINS):
+        xpos, ypos = self._position_sql(x), f"CAST({_sql_ident(y)} AS DOUBLE)"
+        where = self._not_null(x, y)
+        x_lo, x_hi, y_lo, y_hi = map(float, duckdb_query(
+            f"SELECT min({xpos}), max({xpos}), min({ypos}), max({ypos}) FROM {self.relation} WHERE {where}"
+        ).iloc[0])
+        x_lo, x_hi = (x_lo - 0.5, x_hi + 0.5) if x_lo == x_hi else (x_lo, x_hi)
+        y_lo, y_hi = (y_lo - 0.5, y_hi + 0.5) if y_lo == y_hi else (y_lo, y_hi)
+        x_width, y_width = (x_hi - x_lo) / bins, (y_hi - y_lo) / bins
+        cells = duckdb_query(
+            f"SELECT least(floor(({xpos} - {x_lo!r}) / {x_width!r}), {bins - 1}) AS bx, "
+            f"least(floor(({ypos} - {y_lo!r}) / {y_width!r}), {bins - 1}) AS by, count(*) AS n "
+            f"FROM {self.relation} WHERE {where} GROUP BY ALL"
+        )
+        counts = np.zeros((bins, bins))
+        counts[cells["bx"].astype(int), cells["by"].astype(int)] = cells["n"]
+        x_centers = self._from_positions(x, x_lo + (np.arange(bins) + 0.5) * x_width)
+        return counts, x_centers, y_lo + (np.arange(bins) + 0.5) * y_width
+
+    def datetime_columns(self):
+        return [col for col, sql_type in self.types.items() if sql_type.startswith(SQL_DATETIME_TYPES)]
+
+    def datetime_note(self, dt_col):
+        return None
+
+    def time_span(self, dt_col):
+        column = _sql_ident(dt_col)
+        lo, hi = duckdb_query(f"SELECT min({column}), max({column}) FROM {self.relation}").iloc[0]
+        return None if pd.isna(lo) else (pd.Timestamp(lo).tz_localize(None), pd.Timestamp(hi).tz_localize(None))
+
+    def time_series(self, dt_col, columns, how="Mean", finest=None, window=None):
+        """Columns aggregated into time_bucket groups over `window`; DuckDB filters and groups in one scan."""
+        first, last = self.time_span(dt_col)
+        start, end = map(pd.Timestamp, window or (first, last))
+        # Rows in the window, estimated as if they were spread evenly over the whole span
+        rows = self.row_count * min((end - start) / max(last - first, pd.Timedelta(seconds=1)), 1)
+        freq = pick_frequency(start, end, finest, rows=max(int(rows), 1))
+        column = f"CAST({_sql_ident(dt_col)} AS TIMESTAMP)"
+        aggregate = TIME_SERIES_AGGREGATIONS[how][1]
+        aggregates = ", ".join(f"{aggregate}({_sql_ident(col)}) AS {_sql_ident(col)}" for col in columns)
+        series = duckdb_query(
+            f"SELECT time_bucket(INTERVAL '{TIME_SERIES_FREQUENCIES[freq][1]}', {column}) AS __t, {aggregates} "
+            f"FROM {self.relation} WHERE {column} BETWEEN ? AND ? GROUP BY ALL ORDER BY ALL",
+            (start.to_pydatetime(), end.to_pydatetime()),
+        )
+        series = series.set_index("__t")
+        series.index = pd.DatetimeIndex(series.index, name=dt_col)
+        return series, freq
+
+    def export(self, target, fmt):
+        kind, compression = EXPORT_FORMATS[fmt][:2]
+        query = f"SELECT * FROM {self.relation}"
+        cursor = get_duckdb().cursor()
+        try:
+            if kind == "feather":
+                # DuckDB has no Arrow IPC writer; stream record batches into one
+                reader = cursor.execute(query).fetch_record_batch(EXPORT_CHUNK_ROWS)
+                with pa.ipc.new_file(target, reader.schema, options=pa.ipc.IpcWriteOptions(compression="lz4")) as writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+            else:
+                options = "FORMAT parquet" if kind == "parquet" else "FORMAT csv, HEADER, DELIMITER ','"
+                if compression:
+                    options += f", COMPRESSION {compression}"
+                cursor.execute(f"COPY ({query}) TO {_sql_literal(target)} ({options})")
+        finally:
+            cursor.close()
+
+
+@shared_result("duckdb-profiles", spinner="Profiling columns...", max_entries=16)
+def duckdb_profile(_backend, dataset_version):
+    """profile_dataset's result from one aggregate scan plus a top-values query per text column.
+
+    Quartiles (t-digest) and distinct counts (HyperLogLog) are approximate.
+    """
+    numeric_cols = [col for col, sql_type in _backend.types.items() if sql_type.startswith(SQL_NUMERIC_TYPES)]
+    aggregates = []
+    for i, col in enumerate(_backend.columns):
+        ident = _sql_ident(col)
+        aggregates += [f"count({ident}) AS \"count_{i}\"", f"approx_count_distinct({ident}) AS \"unique_{i}\""]
+        if col in numeric_cols:
+            value = f"CAST({ident} AS DOUBLE)"
+            aggregates += [
+                f"avg({value}) AS \"mean_{i}\"", f"stddev_samp({value}) AS \"std_{i}\"", f"min({value}) AS \"min_{i}\"",
+                f"approx_quantile({value}, [0.25, 0.5, 0.75]) AS \"quartiles_{i}\"", f"max({value}) AS \"max_{i}\"",
+            ]
+    scan = duckdb_query(f"SELECT {', '.join(aggregates)} FROM {_backend.relation}").iloc[0]
+    row_count = _backend.row_count
+
+    def top_values(col):
+        top = duckdb_query(
+            f"SELECT {_sql_ident(col)} AS value, count(*) AS n FROM {_backend.relation} "
+            f"GROUP BY ALL ORDER BY n DESC LIMIT {PROFILE_TOP_K}"
+        )
+        return pd.Series(top["n"].to_numpy(), index=top["value"].to_numpy(), name="count")
+
+    other_cols = [col for col in _backend.columns if col not in numeric_cols]
+    with ThreadPoolExecutor(PROFILE_WORKERS) as pool:
+        top = dict(zip(other_cols, pool.map(top_values, other_cols)))
+    stats = {}
+    for i, col in enumerate(_backend.columns):
+        sql_type = _backend.types[col]
+        count = int(scan[f"count_{i}"])
+        col_stats = {"dtype": sql_type, "count": count, "nulls": row_count - count, "unique": int(scan[f"unique_{i}"])}
+        if col in numeric_cols:
+            col_stats["kind"] = "numeric"
+            if count:
+                quartiles = scan[f"quartiles_{i}"]
+                col_stats.update({
+                    "mean": scan[f"mean_{i}"], "std": scan[f"std_{i}"], "min": scan[f"min_{i}"],
+                    "25%": quartiles[0], "50%": quartiles[1], "75%": quartiles[2], "max": scan[f"max_{i}"],
+                })
+        else:
+            col_stats["kind"] = "categorical" if sql_type == "VARCHAR" else "other"
+        stats[col] = col_stats
+    columns = pd.DataFrame(stats).T
+    return {
+        "row_count": row_count,
+        "columns": columns,
+        "numeric_cols": numeric_cols,
+        "categorical_cols": [col for col, col_stats in stats.items() if col_stats["kind"] == "categorical"],
+        "describe": columns.reindex(index=numeric_cols, columns=DESCRIBE_STATS).T.astype("float64"),
+        "missing_percent": (columns["nulls"].astype("float64") / max(row_count, 1)) * 100,
+        "top_values": top,
+        "top_errors": {col: 0 for col in top},
+    }
+
+
+# --- Clustering ---
+CLUSTER_COLUMN = "cluster"
+# MiniBatchKMeans is fitted on a sample this size; every row is then assigned to a centroid
+CLUSTER_SAMPLE_ROWS = int(os.environ.get("CSV_BOT_CLUSTER_ROWS", "50000"))
+CLUSTER_CHUNK_ROWS = 500_000
+CLUSTER_BATCH_SIZE = 4096
+CLUSTER_SEED = 42
+# Each stratum gets its proportional share of the sample, but never fewer rows than this
+STRATUM_MIN_ROWS = 50
+
+
+def stratum_quotas(sizes, n):
+    """Rows to draw from each stratum, at most n in total: proportional to size, on top of a
+    floor of STRATUM_MIN_ROWS per stratum when the floors of every stratum fit in n.
+    """
+    sizes = np.asarray(sizes, dtype="int64")
+    floors = np.minimum(sizes, STRATUM_MIN_ROWS if len(sizes) * STRATUM_MIN_ROWS <= n else 0)
+    rest = sizes - floors
+    share = rest * (n - floors.sum()) / max(rest.sum(), 1)
+    extra = np.minimum(np.floor(share), rest).astype("int64")
+    # Rows lost to rounding down go to the strata with the largest remainders
+    leftover = int(min(n - floors.sum(), rest.sum()) - extra.sum())
+    if leftover > 0:
+        extra[np.argsort(extra - share, kind="stable")[:leftover]] += 1
+    return (floors + extra).tolist()
+
+
+@shared_result("clusters", spinner="Clustering rows...", max_entries=4)
+def cluster_rows(_backend, dataset_version, features, k, stratify_by):
+    """Fit MiniBatchKMeans on a (stratified) sample of standardized features, then assign every row.
+
+    Missing feature values are treated as the column mean. The pandas backend assigns rows
+    here in chunks; DuckDB does it in SQL from the returned centres when a chart asks for them.
+    """
+    started = time.perf_counter()
+    sample = _backend.stratified_sample(stratify_by, CLUSTER_SAMPLE_ROWS, CLUSTER_SEED)[list(features)].astype("float64")
+    means = sample.mean().fillna(0)
+    stds = sample.std(ddof=0).replace(0, 1).fillna(1)
+    model = MiniBatchKMeans(n_clusters=k, batch_size=CLUSTER_BATCH_SIZE, n_init=3, random_state=CLUSTER_SEED)
+    model.fit(((sample - means) / stds).fillna(0).to_numpy())
+    fit_seconds = time.perf_counter() - started
+
+    column = CLUSTER_COLUMN
+    while column in _backend.columns:
+        column += "_"
+    names = [f"Cluster {i}" for i in range(1, k + 1)]
+    clustering = {
+        "column": column,
+        "features": list(features),
+        "means": means.tolist(),
+        "stds": stds.tolist(),
+        "centers": model.cluster_centers_,
+        "digest": hashlib.sha256(repr((features, k, stratify_by)).encode()).hexdigest()[:12],
+        "centroids": pd.DataFrame(model.cluster_centers_ * stds.to_numpy() + means.to_numpy(), index=names, columns=list(features)),
+        "sample_rows": len(sample),
+        "labels": None,
+    }
+    started = time.perf_counter()
+    if _backend.out_of_core:
+        clustered = _backend.with_clusters(clustering)
+        sizes = duckdb_query(f"SELECT {_sql_ident(column)} AS c, count(*) AS n FROM {clustered.relation} GROUP BY ALL")
+        sizes = sizes.set_index("c")["n"]
+    else:
+        codes = np.empty(len(_backend.frame), dtype=np.int8 if k < 128 else np.int16)
+        for start in range(0, len(codes), CLUSTER_CHUNK_ROWS):
+            chunk = _backend.frame.iloc[start:start + CLUSTER_CHUNK_ROWS][list(features)].astype("float64")
+            codes[start:start + len(chunk)] = model.predict(((chunk - means) / stds).fillna(0).to_numpy())
+        clustering["labels"] = pd.Categorical.from_codes(codes, categories=names)
+        sizes = pd.Series(np.bincount(codes, minlength=k), index=names)
+    clustering["sizes"] = sizes.reindex(names, fill_value=0)
+    clustering["timings"] = {"Fit": fit_seconds, "Assign": time.perf_counter() - started}
+    return clustering
+
+
+def clustered_backend(backend):
+    """The backend with the session's cluster column added, if a clustering was run on this data."""
+    options = st.session_state.get("clustering")
+    if not options or options["version"] != backend.version or not set(options["features"]) <= set(backend.columns):
+        return backend
+    return backend.with_clusters(cluster_rows(backend, backend.version, options["features"], options["k"], options["stratify_by"]))
+
+
+# --- Background Stages ---
+# Heavy per-dataset work runs on a shared pool as soon as the data is ready, cheapest stage first
+STAGE_WORKERS = min(4, os.cpu_count() or 1)
+STAGE_POLL_SECONDS = 1.0
+
+
+@st.cache_resource
+def get_stage_executor():
+    return ThreadPoolExecutor(STAGE_WORKERS, thread_name_prefix="csv-bot-stage")
+
+
+def _run_stage(cancelled, stage):
+    if cancelled.is_set():
+        raise CancelledError()
+    return stage()
+
+
+def _cancel_stages(cancelled, futures):
+    cancelled.set()
+    for future in futures:
+        future.cancel()
+
+
+class BackgroundStages:
+    """One session's stages for one dataset version, submitted in order to the shared pool.
+
+    Replacing or dropping the object (new upload, new cleaning step, abandoned session)
+    cancels stages that haven't started; running ones see the flag before their work starts.
+    """
+
+    def __init__(self, version, stages):
+        self.version = version
+        self.cancelled = threading.Event()
+        executor = get_stage_executor()
+        self.futures = {name: executor.submit(_run_stage, self.cancelled, stage) for name, stage in stages.items()}
+        # Runs when the session state that owns this object is garbage collected
+        self._finalizer = weakref.finalize(self, _cancel_stages, self.cancelled, list(self.futures.values()))
+
+    def done(self, name):
+        return self.futures[name].done()
+
+    def all_done(self):
+        return all(future.done() for future in self.futures.values())
+
+    def result(self, name):
+        return self.futures[name].result()
+
+    def cancel(self):
+        self._finalizer()
+
+
+def session_stages(backend, numeric_cols):
+    """The session's background stages for the current data, restarting them when it changes."""
+    stages = st.session_state.get("background_stages")
+    if stages is None or stages.version != backend.version:
+        if stages is not None:
+            stages.cancel()
+        stages = BackgroundStages(backend.version, {
+            "counts": backend.missing_counts,
+            "profile": backend.profile,
+            "correlations": lambda: backend.correlation(numeric_cols) if len(numeric_cols) > 1 else None,
+        })
+        st.session_state["background_stages"] = stages
+    return stages
+
+
+def render_stage_summary(stages, row_count, polling):
+    """Data summary that fills in as stages finish: counts, then quantiles, then correlations."""
+    if stages.done("counts"):
+        nulls = stages.result("counts")
+        st.caption(f"{row_count:,} rows · {int(nulls.sum()):,} missing cells in {int((nulls > 0).sum())} columns")
+    else:
+        st.caption("⏳ Counting missing values...")
+    if stages.done("profile"):
+        st.write(stages.result("profile")["describe"])
+    else:
+        st.caption("⏳ Computing quantiles...")
+    if stages.done("correlations"):
+        correlations = stages.result("correlations")
+        if correlations is not None:
+            st.markdown("**Correlations**")
+            st.write(correlations)
+    else:
+        st.caption("⏳ Computing correlations...")
+    if polling and stages.all_done():
+        # Everything is in; a full rerun redraws this summary without the polling timer
+        st.rerun(scope="app")
+
+
+# --- Export ---
+# label -> (format, compression, file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", None, ".csv", "text/csv"),
+    "CSV (gzip)": ("csv", "gzip", ".csv.gz", "application/gzip"),
+    "CSV (zstd)": ("csv", "zstd", ".csv.zst", "application/zstd"),
+    "Parquet": ("parquet", None, ".parquet", "application/vnd.apache.parquet"),
+    "Feather": ("feather", None, ".feather", "application/vnd.apache.arrow.file"),
+}
+EXPORT_CHUNK_ROWS = 100_000
+EXPORT_DIR = os.path.join(INGEST_SPILL_DIR or tempfile.gettempdir(), "csv-bot-exports")
+# Exported files kept on disk; the oldest are removed beyond this
+EXPORT_MAX_FILES = int(os.environ.get("CSV_BOT_EXPORT_FILES", "16"))
+
+
+@st.cache_resource
+def path_lock(path):
+    """One lock per output file, shared by every session writing it."""
+    return threading.Lock()
+
+
+def export_path(backend, fmt):
+    return os.path.join(EXPORT_DIR, f"cleaned-{backend.version}{EXPORT_FORMATS[fmt][2]}")
+
+
+def export_file(backend, fmt):
+    """Write the dataset in `fmt` once per dataset version and return the file's path."""
+    path = export_path(backend, fmt)
+    with path_lock(path):
+        if not os.path.exists(path):
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            backend.export(path + ".part", fmt)
+            os.replace(path + ".part", path)
+            # Other sessions may be pruning the same directory, so files can vanish mid-scan
+            exports = []
+            for entry in os.scandir(EXPORT_DIR):
+                try:
+                    if not entry.name.endswith(".part"):
+                        exports.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+            remove_files([old_path for _, old_path in sorted(exports)[:-EXPORT_MAX_FILES]])
+    return path
+
+
+# --- PDF Report ---
+REPORT_WORKERS = 2
+REPORT_DIR = os.path.join(INGEST_SPILL_DIR or tempfile.gettempdir(), "csv-bot-reports")
+REPORT_POLL_SECONDS = 1.0
+REPORT_CHART_SIZE = (1000, 560)
+REPORT_CHART_ENTRIES = 64
+# fpdf's core fonts are latin-1; the few non-latin-1 symbols the app writes get ASCII stand-ins
+PDF_TEXT_REPLACEMENTS = str.maketrans({"–": "-", "—": "-", "≈": "~", "…": "...", "→": "->", "·": "-"})
+
+
+@st.cache_resource
+def get_report_executor():
+    return ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+
+
+def pdf_text(value):
+    return str(value).translate(PDF_TEXT_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+
+def chart_image(backend, graph, theme_name):
+    """PNG bytes of one chart, keyed by dataset version, chart spec and theme.
+
+    Returns (png, rendered); images are kept in the shared store rather than on disk,
+    so regenerating a report only rasterizes charts whose data, spec or theme changed.
+    """
+    store = get_shared_store()
+    key = (backend.version, graph, theme_name)
+    found, png = store.lookup("report-charts", key)
+    if found:
+        return png, False
+    with store.key_lock("report-charts", key):
+        found, png = store.lookup("report-charts", key)
+        if found:
+            return png, False
+        fig, _ = build_figure(backend, backend.version, *graph)
+        width, height = REPORT_CHART_SIZE
+        png = apply_theme(fig, PLOTLY_THEMES[theme_name]).to_image(format="png", width=width, height=height)
+        store.register("report-charts", max_entries=REPORT_CHART_ENTRIES)
+        store.put("report-charts", key, png, tag=backend.version)
+    return png, True
+
+
+def describe_graph(graph):
+    graph_type, x, y, group_by, _ = graph
+    return f"{graph_type}: {y} by {x}" + (f", grouped by {group_by}" if group_by else "")
+
+
+class ReportJob:
+    """A PDF report assembled on the report pool; the Export tab polls its progress."""
+
+    def __init__(self, key, build, *args):
+        self.key = key
+        self.progress = 0.0
+        self.status = "Queued"
+        self.timings = {}
+        self.charts_rendered = 0
+        self.charts_reused = 0
+        self.chart_errors = []
+        self.future = get_report_executor().submit(build, self, *args)
+
+    def update(self, progress, status):
+        self.progress, self.status = progress, status
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+
+def pdf_heading(pdf, text):
+    pdf.ln(4)
+    pdf.set_font("Arial", "B", 13)
+    pdf.cell(0, 8, pdf_text(text), ln=1)
+    pdf.set_font("Arial", "", 8)
+
+
+def pdf_table(pdf, header, rows, first_width=40):
+    width = (pdf.w - pdf.l_margin - pdf.r_margin - first_width) / max(len(header) - 1, 1)
+    pdf.set_font("Arial", "B", 8)
+    for i, label in enumerate(header):
+        pdf.cell(first_width if i == 0 else width, 6, pdf_text(label), border=1)
+    pdf.ln()
+    pdf.set_font("Arial", "", 8)
+    for row in rows:
+        for i, value in enumerate(row):
+            pdf.cell(first_width if i == 0 else width, 5, pdf_text(value)[:40], border=1)
+        pdf.ln()
+
+
+def build_report(job, backend, stages, summary, categorical_cols, charts):
+    """Write the report PDF and return its path; progress and timings are left on the job."""
+    started = time.perf_counter()
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 18)
+    pdf.cell(0, 12, "CSV Analysis Report", ln=1)
+    pdf.set_font("Arial", "", 10)
+    pdf.multi_cell(0, 5, pdf_text(summary))
+
+    job.update(0.05, "Waiting for the column profile...")
+    missing_counts = stages.result("counts")
+    profile = stages.result("profile")
+    job.timings["Profile"] = time.perf_counter() - started
+
+    section_started = time.perf_counter()
+    job.update(0.1, "Writing tables...")
+    describe = profile["describe"]
+    if not describe.empty:
+        pdf_heading(pdf, "Column Profile")
+        pdf_table(pdf, ["Column"] + DESCRIBE_STATS, [
+            [col] + [f"{describe.at[stat, col]:.4g}" for stat in DESCRIBE_STATS] for col in describe.columns
+        ])
+    pdf_heading(pdf, "Missing Values")
+    missing = missing_counts[missing_counts > 0]
+    if len(missing):
+        pdf_table(pdf, ["Column", "Missing", "Percent"], [
+            [col, f"{count:,}", f"{count / backend.row_count * 100:.1f}%"] for col, count in missing.items()
+        ], first_width=60)
+    else:
+        pdf.cell(0, 6, "No missing values found.", ln=1)
+    cards = [(col, profile["top_values"][col]) for col in categorical_cols if len(profile["top_values"].get(col, ())) > 0]
+    if cards:
+        pdf_heading(pdf, "Insights")
+        for col, top_values in cards:
+            pdf.set_font("Arial", "B", 9)
+            pdf.cell(0, 5, pdf_text(f"{col}: {top_values.index[0]}"), ln=1)
+            pdf.set_font("Arial", "", 8)
+            for line in insight_lines(top_values, profile["top_errors"][col], backend.row_count):
+                pdf.cell(0, 4, pdf_text("   " + line), ln=1)
+    job.timings["Tables"] = time.perf_counter() - section_started
+
+    section_started = time.perf_counter()
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    # fpdf only embeds images from files; they are read at pdf.image() and removed with the directory
+    with tempfile.TemporaryDirectory(prefix="charts-", dir=REPORT_DIR) as image_dir:
+        for i, (graph, theme_name) in enumerate(charts, start=1):
+            job.update(0.15 + 0.8 * (i - 1) / len(charts), f"Rendering chart {i} of {len(charts)}...")
+            pdf.add_page()
+            pdf_heading(pdf, describe_graph(graph))
+            try:
+                png, rendered = chart_image(backend, graph, theme_name)
+            except Exception as e:
+                error = " ".join(str(e).split())
+                job.chart_errors.append(f"{describe_graph(graph)}: {error}")
+                pdf.multi_cell(0, 5, pdf_text(f"Chart image unavailable: {error}"))
+                continue
+            if rendered:
+                job.charts_rendered += 1
+            else:
+                job.charts_reused += 1
+            image_path = os.path.join(image_dir, f"chart-{i}.png")
+            with open(image_path, "wb") as image_file:
+                image_file.write(png)
+            pdf.image(image_path, x=pdf.l_margin, w=pdf.w - pdf.l_margin - pdf.r_margin)
+    job.timings["Charts"] = time.perf_counter() - section_started
+
+    section_started = time.perf_counter()
+    job.update(0.97, "Writing PDF...")
+    path = os.path.join(REPORT_DIR, f"report-{hashlib.sha256(repr(job.key).encode()).hexdigest()[:24]}.pdf")
+    pdf.output(path + ".part", "F")
+    os.replace(path + ".part", path)
+    job.timings["PDF"] = time.perf_counter() - section_started
+    job.timings["Total"] = time.perf_counter() - started
+    job.update(1.0, "Done")
+    return path
+
+
+def render_report_job(job, polling):
+    """Progress while the report builds; the download button once it's ready."""
+    if not job.done():
+        st.progress(job.progress, text=job.status)
+        return
+    if polling:
+        st.rerun(scope="app")
+    try:
+        path = job.result()
+    except Exception as e:
+        st.markdown(f"""
+        <div class="warning-message">
+            ❌ Error generating report: {e}
+        </div>
+        """, unsafe_allow_html=True)
+        return
+    st.download_button(
+        "📥 Download PDF Report", lambda: Path(path).read_bytes(),
+        file_name="csv_report.pdf", mime="application/pdf", on_click="ignore",
+    )
+    st.caption(
+        " · ".join(f"{stage} {seconds:.2f}s" for stage, seconds in job.timings.items())
+        + f" · {job.charts_rendered} charts rendered, {job.charts_reused} reused"
+    )
+    for error in job.chart_errors:
+        st.caption(f"⚠️ {error}")
+
+
+# --- Mail Queue ---
+SMTP_HOST = os.environ.get("CSV_BOT_SMTP_HOST")
+SMTP_PORT = int(os.environ.get("CSV_BOT_SMTP_PORT", "587"))
+SMTP_USER = os.environ.get("CSV_BOT_SMTP_USER")
+SMTP_PASSWORD = os.environ.get("CSV_BOT_SMTP_PASSWORD")
+SMTP_SENDER = os.environ.get("CSV_BOT_SMTP_SENDER", SMTP_USER or "csv-bot@localhost")
+SMTP_STARTTLS = os.environ.get("CSV_BOT_SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT_SECONDS = 30
+# Each worker keeps one SMTP connection open and closes it after this long without mail
+SMTP_IDLE_SECONDS = 30.0
+MAIL_WORKERS = 2
+MAIL_MAX_ATTEMPTS = 5
+MAIL_BACKOFF_SECONDS = 2.0
+MAIL_POLL_SECONDS = 1.0
+
+
+class MailJob:
+    """One outgoing email; attachments are (file name, MIME type, callable returning a path)."""
+
+    def __init__(self, to, subject, body, attachments=()):
+        self.to = to
+        self.subject = subject
+        self.body = body
+        self.attachments = list(attachments)
+        self.attempts = 0
+        self.status = "Queued"
+        self.done = False
+
+    def message(self):
+        """Build the message, reading attachments from disk only now, on the mail worker."""
+        message = EmailMessage()
+        message["From"] = SMTP_SENDER
+        message["To"] = self.to
+        message["Subject"] = self.subject
+        message.set_content(self.body)
+        for file_name, mime, path in self.attachments:
+            maintype, subtype = mime.split("/", 1)
+            with open(path(), "rb") as attachment:
+                message.add_attachment(attachment.read(), maintype=maintype, subtype=subtype, filename=file_name)
+        return message
+
+    def finish(self, status):
+        self.status, self.done = status, True
+
+
+def _close_quietly(smtp):
+    if smtp is not None:
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+
+def is_retryable(error):
+    """Temporary failures (4xx replies, dropped or refused connections) are worth retrying."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # Socket errors and timeouts; every SMTPException is an OSError too, but the rest are permanent
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class MailQueue:
+    """Outbound mail sent by background workers, so the script thread never waits on SMTP."""
+
+    def __init__(self, workers=MAIL_WORKERS):
+        self.queue = queue.Queue()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"mail-{i}", daemon=True).start()
+
+    def submit(self, job):
+        self.queue.put(job)
+        return job
+
+    def _connect(self):
+        smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USER and SMTP_PASSWORD:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        return smtp
+
+    def _send(self, smtp, message):
+        """Send on the worker's open connection, reconnecting once if the server dropped it."""
+        if smtp is not None:
+            try:
+                smtp.send_message(message)
+                return smtp
+            except smtplib.SMTPServerDisconnected:
+                smtp.close()
+        smtp = self._connect()
+        smtp.send_message(message)
+        return smtp
+
+    def _work(self):
+        smtp = None
+        while True:
+            try:
+                job = self.queue.get(timeout=SMTP_IDLE_SECONDS)
+            except queue.Empty:
+                _close_quietly(smtp)
+                smtp = None
+                continue
+            try:
+                message = job.message()
+            except Exception as e:
+                job.finish(f"Failed: could not attach file ({e})")
+                continue
+            job.attempts += 1
+            job.status = "Sending"
+            try:
+                smtp = self._send(smtp, message)
+                job.finish("Sent")
+            except Exception as e:
+                _close_quietly(smtp)
+                smtp = None
+                if is_retryable(e) and job.attempts < MAIL_MAX_ATTEMPTS:
+                    delay = MAIL_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+                    job.status = f"Retrying in {delay:.0f}s (attempt {job.attempts} failed: {e})"
+                    retry = threading.Timer(delay, self.queue.put, args=(job,))
+                    retry.daemon = True
+                    retry.start()
+                else:
+                    job.finish(f"Failed: {e}")
+
+
+@st.cache_resource
+def get_mail_queue():
+    return MailQueue()
+
+
+def render_mail_jobs(jobs, polling):
+    for job in reversed(jobs[-5:]):
+        icon = "✅" if job.status == "Sent" else "❌" if job.done else "⏳"
+        st.caption(f"{icon} {job.to} · {job.subject}: {job.status}")
+    if polling and all(job.done for job in jobs):
+        st.rerun(scope="app")
+
+
+# --- AutoML ---
+# Training runs in a separate process; rows beyond this are sampled away first
+AUTOML_MAX_ROWS = int(os.environ.get("CSV_BOT_AUTOML_ROWS", "20000"))
+AUTOML_WORKERS = 1
+AUTOML_CACHE_ENTRIES = 16
+AUTOML_SEED = 42
+AUTOML_POLL_SECONDS = 1.0
+AUTOML_MAX_CLASSES = 20
+
+
+@st.cache_resource
+def get_automl_executor():
+    # spawn, not fork: the server process is multi-threaded
+    return ProcessPoolExecutor(max_workers=AUTOML_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+@st.cache_resource
+def get_process_manager():
+    """Owns the queues worker processes report progress on."""
+    return multiprocessing.get_context("spawn").Manager()
+
+
+def automl_task(backend, target, numeric_cols):
+    """Regression for numeric targets with many distinct values, classification otherwise."""
+    if target not in numeric_cols:
+        return "classification"
+    distinct = backend.sample(AUTOML_MAX_ROWS, AUTOML_SEED)[target].nunique()
+    return "classification" if distinct <= AUTOML_MAX_CLASSES else "regression"
+
+
+class AutoMLJob:
+    """One AutoML run in the process pool; per-model results arrive while it trains."""
+
+    def __init__(self, frame, target, task, models, folds):
+        self.task = task
+        self.total = len(models)
+        self.status = "Queued"
+        self.rows = []
+        self._lock = threading.Lock()
+        self._progress = get_process_manager().Queue()
+        args = (frame, target, task, list(models), folds, AUTOML_SEED, self._progress)
+        try:
+            self.future = get_automl_executor().submit(workers.run_automl, *args)
+        except BrokenProcessPool:
+            # A worker died (out of memory, killed); later jobs get a fresh pool
+            get_automl_executor.clear()
+            self.future = get_automl_executor().submit(workers.run_automl, *args)
+
+    def poll(self):
+        """Take in the progress the worker has sent so far."""
+        with self._lock:
+            while True:
+                try:
+                    kind, payload = self._progress.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "model":
+                    self.rows.append(payload)
+                else:
+                    self.status = payload
+        return self
+
+    def done(self):
+        return self.future.done()
+
+    def failed(self):
+        return self.future.done() and self.future.exception() is not None
+
+
+class AutoMLJobs:
+    """AutoML runs shared by every session, keyed by (dataset version, target, options).
+
+    A finished run is kept so reopening the tab or another session asking the same
+    question gets the result straight away; the oldest beyond the limit are dropped.
+    """
+
+    def __init__(self, max_entries=AUTOML_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.jobs.get(key)
+
+    def start(self, key, make_job):
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is None or job.failed():
+                job = self.jobs[key] = make_job()
+            self.jobs.move_to_end(key)
+            finished = [k for k, j in self.jobs.items() if j.done() and k != key]
+            for stale in finished[:max(len(self.jobs) - self.max_entries, 0)]:
+                del self.jobs[stale]
+            return job
+
+
+@st.cache_resource
+def get_automl_jobs():
+    return AutoMLJobs()
+
+
+def render_automl_job(job, polling):
+    job.poll()
+    if not job.done():
+        st.progress(len(job.rows) / max(job.total, 1), text=job.status)
+        if job.rows:
+            st.dataframe(pd.DataFrame(job.rows).set_index("Model"), use_container_width=True)
+        return
+    if polling:
+        st.rerun(scope="app")
+    if job.failed():
+        st.markdown(f"""
+        <div class="warning-message">
+            ❌ AutoML failed: {job.future.exception()}
+        </div>
+        """, unsafe_allow_html=True)
+        return
+    result = job.future.result()
+    st.markdown(f"Best model: **{result['best']}**")
+    st.dataframe(result["leaderboard"], use_container_width=True)
+    if result["importance"] is not None:
+        st.markdown("**Feature Importance**")
+        st.bar_chart(result["importance"].head(15))
+
 
 # Custom CSS for modern styling and animations
 st.markdown("""
@@ -429,11 +3300,86 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
     
-    uploaded_file = st.file_uploader("Choose a CSV file", type=["csv"])
+    uploaded_files = st.file_uploader(
+        "Choose CSV, TSV or Parquet files", type=["csv", "tsv", "gz", "parquet"], accept_multiple_files=True,
+        help="Several files are parsed in parallel and stacked into one dataset with a source_file column (suffixed if the files already have one)."
+    )
+    analysis_backend = ANALYSIS_BACKENDS[st.selectbox(
+        "Analysis Backend", list(ANALYSIS_BACKENDS.keys()), disabled=duckdb is None,
+        help="Out-of-core runs every query in DuckDB over the file on disk, for files larger than memory."
+    )]
+    server_file = None
+    if analysis_backend == "duckdb" and list_server_files():
+        server_file = st.selectbox("Or open a server file", [None] + list_server_files())
+    load_mode = st.selectbox(
+        "Loading Mode", list(LOAD_MODES.keys()), disabled=analysis_backend != "pandas",
+        help="Memory-optimized streams the file in chunks, shrinks numeric types and stores repetitive text as categories."
+    )
+    arrow_dtypes = st.checkbox(
+        "Keep Arrow-backed dtypes", value=False, disabled=load_mode != "Standard" or analysis_backend != "pandas",
+        help="Keep pyarrow column types end to end instead of converting to NumPy."
+    )
+    if STORE_ADMIN_KEY and st.query_params.get("admin") == STORE_ADMIN_KEY:
+        with st.expander("🗄️ Shared Store"):
+            render_store_admin(get_shared_store())
 
-if uploaded_file:
+if uploaded_files or server_file:
     try:
-        df = pd.read_csv(uploaded_file)
+        if analysis_backend == "duckdb":
+            if server_file:
+                source_path, upload_hash = server_source(server_file)
+            else:
+                upload_hash = upload_digest(uploaded_files[0]) if len(uploaded_files) == 1 else uploads_digest(uploaded_files)
+                # Pinned before spilling, so a session closing the same upload can't delete the files under this one
+                lease = session_lease(f"duckdb-{upload_hash}")
+                source_path = [(spill_upload(uploaded_file)[0], uploaded_file.name) for uploaded_file in uploaded_files]
+                lease.on_release(functools.partial(remove_files, [path for path, _ in source_path]))
+                if len(uploaded_files) == 1:
+                    source_path = source_path[0][0]
+        elif len(uploaded_files) == 1:
+            df, dataset_hash = load_dataset(uploaded_files[0], load_mode, arrow_dtypes)
+            upload_hash = upload_digest(uploaded_files[0])
+        else:
+            df, dataset_hash = load_datasets(uploaded_files, load_mode, arrow_dtypes)
+            upload_hash = uploads_digest(uploaded_files)
+        # The cleaning log belongs to one upload; a different file starts a fresh log
+        if st.session_state.get("cleaning_dataset") != upload_hash:
+            st.session_state["cleaning_dataset"] = upload_hash
+            st.session_state["cleaning_ops"] = []
+            st.session_state["report_charts"] = []
+        cleaning_ops = st.session_state["cleaning_ops"]
+        # Keep this dataset's frames and results in the shared store while the session has it open
+        session_lease(f"duckdb-{upload_hash}" if analysis_backend == "duckdb" else dataset_hash)
+        if analysis_backend == "duckdb":
+            backend = DuckDBBackend(source_path, upload_hash, cleaning_ops)
+            source_columns = backend.source_columns
+            sniffed = backend.sniffed
+            parser_desc = "DuckDB, out-of-core"
+            disk_bytes = sum(os.path.getsize(path) for path, _ in source_path) if isinstance(source_path, list) else os.path.getsize(source_path)
+            memory_desc = f"{disk_bytes / 1024**2:,.1f} MB on disk"
+            cache_desc = f"DuckDB memory limit {DUCKDB_MEMORY_LIMIT}, spilling to disk"
+        else:
+            source_columns = df.columns.tolist()
+            df = run_cleaning_pipeline(df, dataset_hash, cleaning_ops)
+            backend = PandasBackend(df, dataset_hash, cleaning_ops)
+            ingest_cache = get_ingest_cache()
+            load_info = ingest_cache.info.get(dataset_hash, {})
+            memory_bytes = ingest_cache.size(dataset_hash)
+            raw_bytes = load_info.get("raw_bytes", memory_bytes)
+            sniffed = load_info.get("sniffed", {})
+            parser_desc = f"{load_info.get('parser', 'cached')} parser"
+            memory_desc = f"{raw_bytes / 1024**2:,.1f} MB → {memory_bytes / 1024**2:,.1f} MB"
+            cache_desc = (
+                f"{ingest_cache.hits} hits / {ingest_cache.misses} misses "
+                f"({ingest_cache.used_bytes / 1024**2:,.1f} of {INGEST_MEMORY_BUDGET_MB:,} MB)"
+            )
+        dataset_version = backend.version
+        if sniffed.get("format") == "csv":
+            format_desc = f"CSV · {sniffed['compression'] or 'uncompressed'} · {sniffed['encoding']} · {sniffed['sep']!r}"
+        else:
+            format_desc = sniffed.get("format", "unknown").capitalize()
+        if len(uploaded_files) > 1 and not server_file:
+            format_desc = f"{len(uploaded_files)} files · {format_desc}"
         st.sidebar.markdown("""
         <div class="success-message">
             ✅ File loaded successfully!
@@ -441,7 +3387,7 @@ if uploaded_file:
         """, unsafe_allow_html=True)
         
         # Check if dataframe is empty
-        if df.empty:
+        if backend.row_count == 0:
             st.markdown("""
             <div class="warning-message">
                 ⚠️ The uploaded file is empty. Please upload a file with data.
@@ -450,9 +3396,13 @@ if uploaded_file:
             st.stop()
             
         # Get column information
-        numeric_cols = df.select_dtypes(include="number").columns.tolist()
-        categorical_cols = df.select_dtypes(include=["object", "category"]).columns.tolist()
-        row_count, col_count = df.shape
+        # Column kinds come from the dtypes alone; the full profile is only computed by the tabs that show it
+        numeric_cols, categorical_cols = backend.column_kinds()
+        row_count, col_count = backend.row_count, len(backend.columns)
+        summary = f"The dataset has {row_count} rows and {col_count} columns. The numerical columns are: {', '.join(numeric_cols)}."
+        if categorical_cols:
+            summary += f" The categorical columns include: {', '.join(categorical_cols)}."
+        stages = session_stages(backend, numeric_cols)
 
         # Display basic file info
         st.sidebar.markdown(f"""
@@ -462,390 +3412,678 @@ if uploaded_file:
             <p><strong>Columns:</strong> {col_count}</p>
             <p><strong>Numeric:</strong> {len(numeric_cols)}</p>
             <p><strong>Categorical:</strong> {len(categorical_cols)}</p>
+            <p><strong>Format:</strong> {format_desc} ({parser_desc})</p>
+            <p><strong>Memory:</strong> {memory_desc}</p>
+            <p><strong>Cache:</strong> {cache_desc}</p>
         </div>
         """, unsafe_allow_html=True)
+        if analysis_backend == "pandas" and "files" in load_info:
+            # Slowest partitions first
+            with st.sidebar.expander("Per-file parse times"):
+                st.dataframe(load_info["files"].sort_values("Seconds", ascending=False), hide_index=True)
+                st.caption(f"{len(load_info['files'])} files parsed in {load_info['parse_seconds']:.2f}s (parse workers: {PARSE_WORKERS})")
 
-        tabs = st.tabs(["📊 Data Preview", "🧹 Cleaning", "📈 Visualizations", "💡 Insights", "📤 Export"])
+        # Only the open tab runs; switching tabs reruns the script with the new tab open
+        tabs = st.tabs(
+            ["📊 Data Preview", "🧹 Cleaning", "📈 Visualizations", "💡 Insights", "📤 Export"],
+            on_change="rerun", key="active_tab",
+        )
 
         with tabs[0]:
-            st.markdown("""
-            <div class="card">
-                <h2 style="color: #1f77b4; margin-bottom: 1rem;">📊 Data Preview</h2>
-            </div>
-            """, unsafe_allow_html=True)
+            if tabs[0].open:
+                st.markdown("""
+                <div class="card">
+                    <h2 style="color: #1f77b4; margin-bottom: 1rem;">📊 Data Preview</h2>
+                </div>
+                """, unsafe_allow_html=True)
             
-            with stylable_container(
-                key="scrollable-preview",
-                css_styles="overflow:auto; max-height:400px;"
-            ):
-                st.dataframe(df)
+                preview_columns = st.multiselect("Columns", backend.columns, default=backend.columns)
+                sort_col, order_col, size_col = st.columns(3)
+                with sort_col:
+                    sort_by = st.selectbox("Sort By", [None] + backend.columns)
+                with order_col:
+                    ascending = st.radio("Order", ["Ascending", "Descending"], horizontal=True) == "Ascending"
+                with size_col:
+                    page_size = st.selectbox("Rows per page", PREVIEW_PAGE_SIZES)
+                filter_col, query_col = st.columns(2)
+                with filter_col:
+                    filter_column = st.selectbox("Filter Column", [None] + backend.columns)
+                with query_col:
+                    query = st.text_input("Contains", disabled=filter_column is None)
+
+                matched_rows = backend.preview_rows(filter_column, query)
+                page_count = max(1, -(-matched_rows // page_size))
+                page = st.number_input(f"Page (of {page_count:,})", min_value=1, max_value=page_count, value=1, step=1)
+                start = (page - 1) * page_size
+                window = backend.preview_page(start, page_size, sort_by, ascending, filter_column, query, preview_columns)
+                with stylable_container(
+                    key="scrollable-preview",
+                    css_styles="overflow:auto; max-height:400px;"
+                ):
+                    st.dataframe(window)
+                st.caption(f"Rows {min(start + 1, matched_rows):,}–{min(start + page_size, matched_rows):,} of {matched_rows:,}"
+                           + (f" (filtered from {row_count:,})" if matched_rows != row_count else ""))
             
-            st.markdown("---")
-            st.markdown("""
-            <div class="card">
-                <h3 style="color: #1f77b4; margin-bottom: 1rem;">📋 Data Summary</h3>
-            </div>
-            """, unsafe_allow_html=True)
-            st.write(df.describe())
+                st.markdown("---")
+                st.markdown("""
+                <div class="card">
+                    <h3 style="color: #1f77b4; margin-bottom: 1rem;">📋 Data Summary</h3>
+                </div>
+                """, unsafe_allow_html=True)
+                polling = not stages.all_done()
+                st.fragment(render_stage_summary, run_every=STAGE_POLL_SECONDS if polling else None)(stages, row_count, polling)
 
         with tabs[1]:
-            st.markdown("""
-            <div class="card">
-                <h2 style="color: #2ca02c; margin-bottom: 1rem;">🧹 Data Cleaning</h2>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown("---")
-            st.markdown("**Missing Values**")
-            missing_percent = df.isnull().mean() * 100
-            missing_data = missing_percent[missing_percent > 0]
-            if len(missing_data) > 0:
-                st.write(missing_data)
-            else:
+            if tabs[1].open:
                 st.markdown("""
-                <div class="success-message">
-                    ✅ No missing values found!
+                <div class="card">
+                    <h2 style="color: #2ca02c; margin-bottom: 1rem;">🧹 Data Cleaning</h2>
                 </div>
                 """, unsafe_allow_html=True)
+            
+                if "cleaning_notice" in st.session_state:
+                    st.markdown(st.session_state.pop("cleaning_notice"), unsafe_allow_html=True)
+
+                st.markdown("---")
+                st.markdown("**Missing Values**")
+                missing_counts = stages.result("counts")
+                missing_percent = missing_counts / max(row_count, 1) * 100
+                missing_data = missing_percent[missing_percent > 0]
+                if len(missing_data) > 0:
+                    st.write(missing_data)
+                else:
+                    st.markdown("""
+                    <div class="success-message">
+                        ✅ No missing values found!
+                    </div>
+                    """, unsafe_allow_html=True)
 
-            if len(df.columns) > 0:
-                col_to_fix = st.selectbox("Select column to fix", df.columns)
-                method = st.radio("Choose fix method", ["Drop rows", "Fill with Mean", "Fill with Median", "Fill with Mode"])
+                if len(backend.columns) > 0:
+                    col_to_fix = st.selectbox("Select column to fix", backend.columns)
+                    method = st.radio("Choose fix method", ["Drop rows", "Fill with Mean", "Fill with Median", "Fill with Mode"])
 
-                if st.button("Apply Fix"):
-                    try:
+                    if st.button("Apply Fix"):
                         if method == "Drop rows":
-                            df.dropna(subset=[col_to_fix], inplace=True)
-                        elif method == "Fill with Mean" and df[col_to_fix].dtype in ['int64', 'float64']:
-                            df[col_to_fix].fillna(df[col_to_fix].mean(), inplace=True)
-                        elif method == "Fill with Median" and df[col_to_fix].dtype in ['int64', 'float64']:
-                            df[col_to_fix].fillna(df[col_to_fix].median(), inplace=True)
-                        elif method == "Fill with Mode":
-                            mode_value = df[col_to_fix].mode()
-                            if len(mode_value) > 0:
-                                df[col_to_fix].fillna(mode_value[0], inplace=True)
-                        else:
+                            new_op = {"op": "dropna", "column": col_to_fix}
+                        elif method in ("Fill with Mean", "Fill with Median") and col_to_fix not in numeric_cols:
+                            new_op = None
+                            st.markdown(f"""
+                            <div class="warning-message">
+                                ⚠️ {method} needs a numeric column
+                            </div>
+                            """, unsafe_allow_html=True)
+                        elif method == "Fill with Mode" and missing_counts[col_to_fix] == row_count:
+                            new_op = None
                             st.markdown("""
                             <div class="warning-message">
                                 ⚠️ No mode found for this column
                             </div>
                             """, unsafe_allow_html=True)
-                        st.markdown("""
+                        else:
+                            new_op = {"op": "fillna", "column": col_to_fix, "strategy": FILL_STRATEGIES[method]}
+                        if new_op:
+                            cleaning_ops.append(new_op)
+                            st.session_state["cleaning_notice"] = """
+                            <div class="success-message">
+                                ✅ Column cleaned successfully!
+                            </div>
+                            """
+                            st.rerun()
+
+                if len(missing_data) > 0:
+                    st.markdown("**Batch Imputation**")
+                    impute_strategies = [
+                        label for label, strategy in IMPUTE_STRATEGIES.items()
+                        if not (backend.out_of_core and strategy in MODEL_IMPUTERS)
+                    ]
+                    impute_cols = st.multiselect("Columns to impute", missing_data.index.tolist())
+                    impute_method = st.selectbox(
+                        "Imputation method", impute_strategies,
+                        help="Mode fills any column; the other methods fill numeric columns. KNN and iterative "
+                             "imputers predict from every numeric column, learning from up to "
+                             f"{KNN_SAMPLE_ROWS:,} and {IMPUTE_SAMPLE_ROWS:,} sampled rows."
+                    )
+                    if st.button("Impute Columns", disabled=not impute_cols):
+                        strategy = IMPUTE_STRATEGIES[impute_method]
+                        if strategy != "mode" and not any(col in numeric_cols for col in impute_cols):
+                            st.markdown(f"""
+                            <div class="warning-message">
+                                ⚠️ {impute_method} needs at least one numeric column
+                            </div>
+                            """, unsafe_allow_html=True)
+                        else:
+                            cleaning_ops.append({"op": "impute", "columns": impute_cols, "strategy": strategy})
+                            st.session_state["cleaning_notice"] = f"""
+                            <div class="success-message">
+                                ✅ Imputed {len(impute_cols)} columns!
+                            </div>
+                            """
+                            st.rerun()
+
+                st.markdown("---")
+                st.markdown("**Duplicate Rows**")
+                duplicate_subset = st.multiselect("Compare columns (all if empty)", backend.columns)
+                duplicate_count = backend.duplicate_count(duplicate_subset)
+                if duplicate_count > 0:
+                    st.write(f"Found {duplicate_count} duplicates")
+                    if st.button("Remove Duplicates"):
+                        cleaning_ops.append({"op": "drop_duplicates", "columns": duplicate_subset} if duplicate_subset
+                                            else {"op": "drop_duplicates"})
+                        st.session_state["cleaning_notice"] = """
                         <div class="success-message">
-                            ✅ Column cleaned successfully!
+                            ✅ Duplicates removed!
                         </div>
-                        """, unsafe_allow_html=True)
+                        """
+                        st.rerun()
+                else:
+                    st.markdown("""
+                    <div class="success-message">
+                        ✅ No duplicates found
+                    </div>
+                    """, unsafe_allow_html=True)
+
+                st.markdown("---")
+                st.markdown("**Cleaning Steps**")
+                if cleaning_ops:
+                    step_info = [None] * len(cleaning_ops) if backend.out_of_core else pipeline_step_info(backend.dataset_hash, cleaning_ops)
+                    st.markdown("\n".join(
+                        f"{i}. {describe_op(op)}{describe_step_info(info)}"
+                        for i, (op, info) in enumerate(zip(cleaning_ops, step_info), start=1)
+                    ))
+                    undo_col, reset_col, export_col = st.columns(3)
+                    with undo_col:
+                        if st.button("Undo Last Step"):
+                            cleaning_ops.pop()
+                            st.rerun()
+                    with reset_col:
+                        if st.button("Reset Steps"):
+                            cleaning_ops.clear()
+                            st.rerun()
+                    with export_col:
+                        st.download_button(
+                            "Export Steps",
+                            json.dumps({"columns": source_columns, "steps": cleaning_ops}, indent=2),
+                            file_name="cleaning_steps.json",
+                            mime="application/json",
+                        )
+                else:
+                    st.markdown("""
+                    <div class="info-message">
+                        ℹ️ No cleaning steps yet. Steps you apply are kept across reruns and can be exported.
+                    </div>
+                    """, unsafe_allow_html=True)
+
+                steps_file = st.file_uploader("Replay exported steps", type=["json"], key="replay_steps")
+                if steps_file and st.session_state.get("replayed_steps_file") != steps_file.file_id:
+                    st.session_state["replayed_steps_file"] = steps_file.file_id
+                    try:
+                        exported = json.load(steps_file)
+                        replayed = validate_ops(exported["steps"], source_columns, exported.get("columns"))
+                        cleaning_ops[:] = replayed
+                        st.session_state["cleaning_notice"] = f"""
+                        <div class="success-message">
+                            ✅ Replayed {len(replayed)} cleaning steps
+                        </div>
+                        """
+                        st.rerun()
                     except Exception as e:
                         st.markdown(f"""
                         <div class="warning-message">
-                            ❌ Error cleaning column: {e}
+                            ❌ Could not replay steps: {e}
                         </div>
                         """, unsafe_allow_html=True)
 
-            st.markdown("---")
-            st.markdown("**Duplicate Rows**")
-            duplicate_count = df.duplicated().sum()
-            if duplicate_count > 0:
-                st.write(f"Found {duplicate_count} duplicates")
-                if st.button("Remove Duplicates"):
-                    df.drop_duplicates(inplace=True)
-                    st.markdown("""
-                    <div class="success-message">
-                        ✅ Duplicates removed!
-                    </div>
-                    """, unsafe_allow_html=True)
-            else:
+        with tabs[2]:
+            if tabs[2].open:
                 st.markdown("""
-                <div class="success-message">
-                    ✅ No duplicates found
+                <div class="card">
+                    <h2 style="color: #d62728; margin-bottom: 1rem;">📈 Visualizations</h2>
                 </div>
                 """, unsafe_allow_html=True)
-
-        with tabs[2]:
-            st.markdown("""
-            <div class="card">
-                <h2 style="color: #d62728; margin-bottom: 1rem;">📈 Visualizations</h2>
-            </div>
-            """, unsafe_allow_html=True)
             
-            if len(numeric_cols) > 0:
-                theme_name = st.selectbox("Graph Color Theme", list(PLOTLY_THEMES.keys()), index=0)
-                theme = PLOTLY_THEMES[theme_name]
-                plot_bg = theme["bg"]
-                color_seq = theme["colors"]
-
-                graph_type = st.selectbox("Graph Type", ["Line", "Bar", "Scatter", "Box", "Histogram", "Heatmap"])
-                x_axis = st.selectbox("X Axis", df.columns)
-                y_axis = st.selectbox("Y Axis", numeric_cols)
-                group_by = st.selectbox("Group By (Optional)", [None] + df.columns.tolist())
-
-                if st.button("Generate Graph"):
-                    try:
-                        if graph_type == "Line":
-                            fig = px.line(df, x=x_axis, y=y_axis, color=group_by, color_discrete_sequence=color_seq)
-                        elif graph_type == "Bar":
-                            fig = px.bar(df, x=x_axis, y=y_axis, color=group_by, color_discrete_sequence=color_seq)
-                        elif graph_type == "Scatter":
-                            fig = px.scatter(df, x=x_axis, y=y_axis, color=group_by, color_discrete_sequence=color_seq)
-                        elif graph_type == "Box":
-                            fig = px.box(df, x=x_axis, y=y_axis, color=group_by, color_discrete_sequence=color_seq)
-                        elif graph_type == "Histogram":
-                            fig = px.histogram(df, x=x_axis, y=y_axis, color=group_by, color_discrete_sequence=color_seq)
-                        elif graph_type == "Heatmap":
-                            if len(numeric_cols) > 1:
-                                fig = px.imshow(df[numeric_cols].corr(), color_continuous_scale=color_seq)
-                            else:
-                                st.markdown("""
-                                <div class="warning-message">
-                                    ⚠️ Need at least 2 numeric columns for heatmap
+                if len(numeric_cols) > 0:
+                    theme_name = st.selectbox("Graph Color Theme", list(PLOTLY_THEMES.keys()), index=0)
+                    theme = PLOTLY_THEMES[theme_name]
+
+                    # Charts can be grouped by the clusters from the Insights tab
+                    chart_backend = clustered_backend(backend)
+                    graph_type = st.selectbox("Graph Type", ["Line", "Bar", "Scatter", "Box", "Histogram", "Heatmap"])
+                    x_axis = st.selectbox("X Axis", backend.columns)
+                    y_axis = st.selectbox("Y Axis", numeric_cols)
+                    group_by = st.selectbox("Group By (Optional)", [None] + chart_backend.columns)
+                    graph_options = ()
+                    if graph_type in ("Line", "Scatter"):
+                        point_budget = st.number_input(
+                            "Max points per chart", min_value=500, max_value=500_000, value=DEFAULT_POINT_BUDGET, step=500,
+                            help="Line charts are reduced with LTTB, scatter plots with min-max bucketing."
+                        )
+                        full_resolution = st.checkbox("Full resolution", value=False)
+                        render_choice = st.selectbox(
+                            "Render Backend", RENDER_BACKENDS if graph_type == "Scatter" else RENDER_BACKENDS[:3]
+                        )
+                        with st.expander("Auto backend thresholds"):
+                            webgl_min_points = st.number_input(
+                                "WebGL from (points drawn)", min_value=100, value=WEBGL_MIN_POINTS, step=1000
+                            )
+                            density_min_points = st.number_input(
+                                "Density heatmap from (rows)", min_value=1000, value=DENSITY_MIN_POINTS, step=10000
+                            )
+                        graph_options = (
+                            ("point_budget", point_budget), ("full_resolution", full_resolution),
+                            ("render_choice", render_choice), ("webgl_min_points", webgl_min_points),
+                            ("density_min_points", density_min_points),
+                        )
+                    elif graph_type == "Bar":
+                        bar_agg = st.selectbox("Bar Aggregation", list(BAR_AGGREGATIONS.keys()))
+                        graph_options = (("bar_agg", BAR_AGGREGATIONS[bar_agg]),)
+                    elif graph_type == "Histogram":
+                        histogram_bins = st.slider("Bins", min_value=5, max_value=200, value=DEFAULT_HISTOGRAM_BINS)
+                        graph_options = (("bins", histogram_bins),)
+                    elif graph_type == "Heatmap":
+                        graph_options = (("columns", tuple(numeric_cols)),)
+
+                    if st.button("Generate Graph"):
+                        if graph_type == "Heatmap" and len(numeric_cols) < 2:
+                            st.markdown("""
+                            <div class="warning-message">
+                                ⚠️ Need at least 2 numeric columns for heatmap
+                            </div>
+                            """, unsafe_allow_html=True)
+                        else:
+                            st.session_state["active_graph"] = (graph_type, x_axis, y_axis, group_by, graph_options)
+
+                    # The last generated chart stays up across reruns; only a theme change restyles it
+                    active_graph = st.session_state.get("active_graph")
+                    if active_graph and all(col in chart_backend.columns for col in active_graph[1:4] if col):
+                        try:
+                            fig, render_info = build_figure(chart_backend, chart_backend.version, *active_graph)
+                            st.plotly_chart(apply_theme(fig, theme), use_container_width=True)
+                            report_charts = st.session_state.setdefault("report_charts", [])
+                            if st.button("Add to Report", disabled=(active_graph, theme_name) in report_charts):
+                                report_charts.append((active_graph, theme_name))
+                                st.rerun()
+                            render_backend = render_info["render_backend"]
+                            source_points, plotted_points = render_info["source_points"], render_info["plotted_points"]
+                            if render_backend:
+                                drawn = f"{source_points:,} rows binned" if render_backend == "Density" else f"{plotted_points:,} points"
+                                dropped = f" · not grouped by {active_graph[3]}" if render_backend == "Density" and active_graph[3] else ""
+                                st.caption(f"Rendered with {render_backend} ({drawn}){dropped}")
+                            if render_backend in ("SVG", "WebGL") and plotted_points < source_points:
+                                if backend.out_of_core and full_resolution:
+                                    hint = f"Out-of-core charts are capped at {DUCKDB_MAX_CHART_POINTS:,} points."
+                                else:
+                                    hint = 'Tick "Full resolution" to plot every point.'
+                                st.markdown(f"""
+                                <div class="info-message">
+                                    ℹ️ Downsampled from {source_points:,} to {plotted_points:,} points. {hint}
                                 </div>
                                 """, unsafe_allow_html=True)
-                                fig = None
-                        # Apply custom layout to all figures
-                        if fig:
-                            fig.update_layout(
-                                paper_bgcolor=plot_bg,
-                                plot_bgcolor=plot_bg,
-                                font=dict(family='Inter, sans-serif', color='#fff', size=16),
-                                xaxis=dict(gridcolor='#333', zerolinecolor='#555', linecolor='#888', tickfont=dict(color='#fff')),
-                                yaxis=dict(gridcolor='#333', zerolinecolor='#555', linecolor='#888', tickfont=dict(color='#fff')),
-                                legend=dict(bgcolor='rgba(0,0,0,0)', font=dict(color='#fff', size=14)),
-                                margin=dict(l=40, r=40, t=60, b=40),
+                        except Exception as e:
+                            st.markdown(f"""
+                            <div class="warning-message">
+                                ❌ Error generating graph: {e}
+                            </div>
+                            """, unsafe_allow_html=True)
+                else:
+                    st.markdown("""
+                    <div class="warning-message">
+                        ⚠️ No numeric columns found for visualization
+                    </div>
+                    """, unsafe_allow_html=True)
+
+                st.markdown("---")
+                st.markdown("**Time Series Detection**")
+                datetime_cols = backend.datetime_columns()
+
+                if datetime_cols and len(numeric_cols) > 0:
+                    try:
+                        dt_col = st.selectbox("Select datetime column", datetime_cols)
+                        note = backend.datetime_note(dt_col)
+                        if note:
+                            st.caption(f"⚠️ {note}")
+                        freq_col, how_col = st.columns(2)
+                        with freq_col:
+                            finest = st.selectbox(
+                                "Resample Frequency", ["Auto"] + list(TIME_SERIES_FREQUENCIES),
+                                help=f"Auto picks the finest frequency that fits {TIME_SERIES_MAX_POINTS:,} points; "
+                                     "a fixed choice is coarsened if it would draw more."
+                            )
+                        with how_col:
+                            how = st.selectbox("Aggregation", list(TIME_SERIES_AGGREGATIONS))
+                        span = backend.time_span(dt_col)
+                        if span is None:
+                            raise ValueError(f"{dt_col} has no parseable timestamps")
+                        start, end = (ts.to_pydatetime() for ts in span)
+                        window = None
+                        if start < end:
+                            window = st.slider(
+                                "Zoom", min_value=start, max_value=end, value=(start, end),
+                                step=max((end - start) / 500, pd.Timedelta(seconds=1).to_pytimedelta()),
+                                format="YYYY-MM-DD HH:mm", key=f"time_zoom_{dt_col}",
+                                help="Narrowing the window re-aggregates only the rows inside it, at a finer frequency when it fits."
                             )
-                            st.plotly_chart(fig, use_container_width=True)
+                        series, freq = backend.time_series(dt_col, numeric_cols, how, None if finest == "Auto" else finest, window)
+                        st.line_chart(series)
+                        st.caption(f"{len(series):,} {freq.lower()} buckets · {how.lower()} per bucket")
                     except Exception as e:
                         st.markdown(f"""
                         <div class="warning-message">
-                            ❌ Error generating graph: {e}
+                            ❌ Error creating time series chart: {e}
                         </div>
                         """, unsafe_allow_html=True)
-            else:
+                else:
+                    st.markdown("""
+                    <div class="info-message">
+                        ℹ️ No datetime columns detected or no numeric columns for time series
+                    </div>
+                    """, unsafe_allow_html=True)
+
+        with tabs[3]:
+            if tabs[3].open:
                 st.markdown("""
-                <div class="warning-message">
-                    ⚠️ No numeric columns found for visualization
+                <div class="card">
+                    <h2 style="color: #9467bd; margin-bottom: 1rem;">💡 Insights</h2>
                 </div>
                 """, unsafe_allow_html=True)
-
-            st.markdown("---")
-            st.markdown("**Time Series Detection**")
-            datetime_cols = []
             
-            # First check for existing datetime columns
-            existing_datetime_cols = df.select_dtypes(include=["datetime", "datetime64"]).columns.tolist()
-            datetime_cols.extend(existing_datetime_cols)
+                st.markdown("---")
+                # --- Carousel Insights ---
+                st.markdown("""
+                <style>
+                .insight-container {
+                    display: flex;
+                    overflow-x: auto;
+                    gap: 12px;
+                    padding: 10px 0 18px 0;
+                    scrollbar-width: thin;
+                    -webkit-overflow-scrolling: touch;
+                }
+                .insight-card {
+                    min-width: 180px;
+                    flex: 0 0 auto;
+                    background: #23272f;
+                    color: #fff;
+                    border-radius: 12px;
+                    box-shadow: 0 2px 8px rgba(102, 126, 234, 0.10);
+                    padding: 1rem 1rem 0.7rem 1rem;
+                    border-left: 4px solid #9467bd;
+                    display: flex;
+                    flex-direction: column;
+                    align-items: flex-start;
+                    transition: transform 0.18s, box-shadow 0.18s;
+                }
+                .insight-card:hover {
+                    transform: translateY(-4px) scale(1.03);
+                    box-shadow: 0 6px 18px rgba(102, 126, 234, 0.18);
+                    border-left: 4px solid #FFD93D;
+                }
+                .insight-icon {
+                    font-size: 1.7rem;
+                    margin-bottom: 0.5rem;
+                }
+                .insight-title {
+                    font-size: 1rem;
+                    font-weight: 600;
+                    margin-bottom: 0.2rem;
+                }
+                .insight-data {
+                    font-size: 1.2rem;
+                    font-weight: 700;
+                    margin-bottom: 0.1rem;
+                }
+                .insight-desc {
+                    font-size: 0.95rem;
+                    color: #bdbdbd;
+                }
+                </style>
+                """, unsafe_allow_html=True)
             
-            # Try to convert potential datetime columns
-            for col in df.columns:
-                if col not in datetime_cols:  # Skip if already detected as datetime
-                    try:
-                        # Create a copy to test conversion without modifying original
-                        test_series = pd.to_datetime(df[col], errors='coerce')
-                        # Only add if conversion was successful (not all NaT)
-                        if test_series.notna().sum() > 0:
-                            df[col] = test_series
-                            datetime_cols.append(col)
-                    except Exception:
+                # Generate insights for each categorical column
+                value_icon_map = {
+                    'male': '👨', 'm': '👨', 'female': '👩', 'f': '👩',
+                    'mobile': '📱', 'desktop': '🖥️', 'tablet': '💊', 'laptop': '💻',
+                    'credit card': '💳', 'debit card': '🏧', 'paypal': '💸', 'cash': '💵',
+                    'success': '✅', 'failed': '❌', 'pending': '⏳',
+                    'q': '🚢', 'c': '⚓', 's': '🛳️',
+                    'economy': '💺', 'business': '🛫', 'first': '👑',
+                    'child': '🧒', 'teen': '🧑', 'adult': '🧑‍💼', 'senior': '🧓',
+                    'yes': '👍', 'no': '👎',
+                    'true': '✔️', 'false': '❌',
+                    'cabin': '🛏️', 'ticket': '🎫', 'name': '🧑‍💼', 'class': '🎟️', 'pclass': '🎟️',
+                    'embarked': '🛳️', 'port': '🛳️', 'city': '🏙️', 'country': '🌍', 'email': '✉️',
+                    'date': '📅', 'time': '⏰', 'amount': '💰', 'score': '⭐', 'rating': '🌟',
+                }
+                with st.spinner("Profiling columns..."):
+                    profile = stages.result("profile")
+                carousel_html = '<div class="insight-container">'
+                for col in categorical_cols:
+                    vc = profile["top_values"][col]
+                    top_error = profile["top_errors"][col]
+                    if len(vc) == 0:
                         continue
+                    top_val = vc.index[0]
+                    icon = value_icon_map.get(str(top_val).strip().lower(),
+                            value_icon_map.get(col.strip().lower(), '📊'))
+                    title = f"{col}"
+                    data = f"{top_val}"
+                    desc = "<br>".join(insight_lines(vc, top_error, row_count))
+                    card_html = f'''
+                    <div class="insight-card">
+                        <div class="insight-icon">{icon}</div>
+                        <div class="insight-title">{title}</div>
+                        <div class="insight-data">{data}</div>
+                        <div class="insight-desc">{desc}</div>
+                    </div>
+                    '''
+                    carousel_html += card_html
+                carousel_html += '</div>'
+                st.markdown(carousel_html, unsafe_allow_html=True)
+                st.markdown("---")
 
-            if datetime_cols and len(numeric_cols) > 0:
-                try:
-                    dt_col = st.selectbox("Select datetime column", datetime_cols)
-                    if dt_col in df.columns and dt_col in numeric_cols:
-                        # Remove datetime column from numeric cols for plotting
-                        plot_numeric_cols = [col for col in numeric_cols if col != dt_col]
-                        if plot_numeric_cols:
-                            st.line_chart(df.set_index(dt_col)[plot_numeric_cols])
-                        else:
-                            st.markdown("""
-                            <div class="info-message">
-                                ℹ️ No numeric columns available for time series plotting
-                            </div>
-                            """, unsafe_allow_html=True)
-                    else:
-                        st.line_chart(df.set_index(dt_col)[numeric_cols])
-                except Exception as e:
+                st.markdown("---")
+                st.markdown("**Auto Summary**")
+                if categorical_cols:
                     st.markdown(f"""
-                    <div class="warning-message">
-                        ❌ Error creating time series chart: {e}
+                    <div class="info-message">
+                        📋 {summary}
                     </div>
                     """, unsafe_allow_html=True)
-            else:
-                st.markdown("""
-                <div class="info-message">
-                    ℹ️ No datetime columns detected or no numeric columns for time series
-                </div>
-                """, unsafe_allow_html=True)
 
-        with tabs[3]:
-            st.markdown("""
-            <div class="card">
-                <h2 style="color: #9467bd; margin-bottom: 1rem;">💡 Insights</h2>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown("---")
-            # --- Carousel Insights ---
-            st.markdown("""
-            <style>
-            .insight-container {
-                display: flex;
-                overflow-x: auto;
-                gap: 12px;
-                padding: 10px 0 18px 0;
-                scrollbar-width: thin;
-                -webkit-overflow-scrolling: touch;
-            }
-            .insight-card {
-                min-width: 180px;
-                flex: 0 0 auto;
-                background: #23272f;
-                color: #fff;
-                border-radius: 12px;
-                box-shadow: 0 2px 8px rgba(102, 126, 234, 0.10);
-                padding: 1rem 1rem 0.7rem 1rem;
-                border-left: 4px solid #9467bd;
-                display: flex;
-                flex-direction: column;
-                align-items: flex-start;
-                transition: transform 0.18s, box-shadow 0.18s;
-            }
-            .insight-card:hover {
-                transform: translateY(-4px) scale(1.03);
-                box-shadow: 0 6px 18px rgba(102, 126, 234, 0.18);
-                border-left: 4px solid #FFD93D;
-            }
-            .insight-icon {
-                font-size: 1.7rem;
-                margin-bottom: 0.5rem;
-            }
-            .insight-title {
-                font-size: 1rem;
-                font-weight: 600;
-                margin-bottom: 0.2rem;
-            }
-            .insight-data {
-                font-size: 1.2rem;
-                font-weight: 700;
-                margin-bottom: 0.1rem;
-            }
-            .insight-desc {
-                font-size: 0.95rem;
-                color: #bdbdbd;
-            }
-            </style>
-            """, unsafe_allow_html=True)
-            
-            # Generate insights for each categorical column
-            value_icon_map = {
-                'male': '👨', 'm': '👨', 'female': '👩', 'f': '👩',
-                'mobile': '📱', 'desktop': '🖥️', 'tablet': '💊', 'laptop': '💻',
-                'credit card': '💳', 'debit card': '🏧', 'paypal': '💸', 'cash': '💵',
-                'success': '✅', 'failed': '❌', 'pending': '⏳',
-                'q': '🚢', 'c': '⚓', 's': '🛳️',
-                'economy': '💺', 'business': '🛫', 'first': '👑',
-                'child': '🧒', 'teen': '🧑', 'adult': '🧑‍💼', 'senior': '🧓',
-                'yes': '👍', 'no': '👎',
-                'true': '✔️', 'false': '❌',
-                'cabin': '🛏️', 'ticket': '🎫', 'name': '🧑‍💼', 'class': '🎟️', 'pclass': '🎟️',
-                'embarked': '🛳️', 'port': '🛳️', 'city': '🏙️', 'country': '🌍', 'email': '✉️',
-                'date': '📅', 'time': '⏰', 'amount': '💰', 'score': '⭐', 'rating': '🌟',
-            }
-            carousel_html = '<div class="insight-container">'
-            for col in categorical_cols:
-                vc = df[col].value_counts(dropna=False)
-                if len(vc) == 0:
-                    continue
-                top_val = vc.index[0]
-                top_count = vc.iloc[0]
-                percent = (top_count / len(df)) * 100
-                icon = value_icon_map.get(str(top_val).strip().lower(),
-                        value_icon_map.get(col.strip().lower(), '📊'))
-                title = f"{col}"
-                data = f"{top_val}"
-                desc = f"{percent:.1f}% of total ({top_count}/{len(df)})"
-                card_html = f'''
-                <div class="insight-card">
-                    <div class="insight-icon">{icon}</div>
-                    <div class="insight-title">{title}</div>
-                    <div class="insight-data">{data}</div>
-                    <div class="insight-desc">{desc}</div>
-                </div>
-                '''
-                carousel_html += card_html
-            carousel_html += '</div>'
-            st.markdown(carousel_html, unsafe_allow_html=True)
-            st.markdown("---")
-
-            st.markdown("---")
-            st.markdown("**Auto Summary**")
-            summary = f"The dataset has {row_count} rows and {col_count} columns. The numerical columns are: {', '.join(numeric_cols)}."
-            if categorical_cols:
-                summary += f" The categorical columns include: {', '.join(categorical_cols)}."
-                
-                st.markdown(f"""
-                <div class="info-message">
-                    📋 {summary}
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown("---")
+                st.markdown("**Clustering**")
+                if numeric_cols:
+                    last_clustering = st.session_state.get("clustering") or {}
+                    cluster_features = st.multiselect(
+                        "Cluster on", numeric_cols,
+                        default=[col for col in last_clustering.get("features", numeric_cols) if col in numeric_cols],
+                    )
+                    cluster_k = st.slider("Number of clusters", min_value=2, max_value=12, value=last_clustering.get("k", 4))
+                    stratify_options = [None] + categorical_cols
+                    cluster_stratify = st.selectbox(
+                        "Stratify sample by", stratify_options,
+                        index=stratify_options.index(last_clustering.get("stratify_by")) if last_clustering.get("stratify_by") in stratify_options else 0,
+                        help="Sample every group of this column so small groups still shape the clusters.",
+                    )
+                    if st.button("Run Clustering", disabled=not cluster_features):
+                        st.session_state["clustering"] = {
+                            "version": dataset_version, "features": tuple(cluster_features), "k": cluster_k, "stratify_by": cluster_stratify,
+                        }
+                    clustering_options = st.session_state.get("clustering")
+                    if clustering_options and clustering_options["version"] == dataset_version:
+                        clustering = cluster_rows(
+                            backend, dataset_version, clustering_options["features"], clustering_options["k"], clustering_options["stratify_by"]
+                        )
+                        st.dataframe(
+                            clustering["centroids"].assign(Rows=clustering["sizes"]), use_container_width=True
+                        )
+                        st.caption(
+                            f"Fitted on {clustering['sample_rows']:,} sampled rows in {clustering['timings']['Fit']:.2f}s, "
+                            f"assigned {row_count:,} rows in {clustering['timings']['Assign']:.2f}s. "
+                            f"Group charts by \"{clustering['column']}\" in Visualizations."
+                        )
+                else:
+                    st.markdown("""
+                    <div class="info-message">
+                        ℹ️ Clustering needs at least one numeric column
+                    </div>
+                    """, unsafe_allow_html=True)
 
-            st.markdown("---")
-            st.markdown("**AutoML & Feature Importance**")
-            st.markdown("""
-            <div class="warning-message">
-                🚧 ML Analysis feature is temporarily disabled while pycaret is installing. Please wait for the installation to complete.
-            </div>
-            """, unsafe_allow_html=True)
+                st.markdown("---")
+                st.markdown("**AutoML & Feature Importance**")
+                # Widget state is dropped while the tab is closed; the last run's options bring its result back
+                last_run = st.session_state.get("automl_options", {})
+                target_index = backend.columns.index(last_run["target"]) if last_run.get("target") in backend.columns else len(backend.columns) - 1
+                automl_target = st.selectbox("Target Column", backend.columns, index=target_index)
+                default_task = last_run["task"] if last_run.get("target") == automl_target else automl_task(backend, automl_target, numeric_cols)
+                automl_task_name = st.radio(
+                    "Task", ["classification", "regression"], index=["classification", "regression"].index(default_task),
+                    format_func=str.capitalize, horizontal=True
+                )
+                model_names = workers.AUTOML_MODELS[automl_task_name]
+                automl_models = st.multiselect(
+                    "Models", list(model_names), format_func=model_names.get,
+                    default=last_run["models"] if last_run.get("task") == automl_task_name else list(model_names),
+                )
+                automl_folds = st.number_input("Cross-validation folds", min_value=2, max_value=10, value=last_run.get("folds", 3))
+                if row_count > AUTOML_MAX_ROWS:
+                    st.caption(f"Trained on a {AUTOML_MAX_ROWS:,}-row sample of {row_count:,} rows.")
+                automl_key = (dataset_version, automl_target, automl_task_name, tuple(automl_models), automl_folds)
+                automl_jobs = get_automl_jobs()
+                if st.button("Run AutoML", disabled=not automl_models):
+                    st.session_state["automl_options"] = {
+                        "target": automl_target, "task": automl_task_name, "models": automl_models, "folds": automl_folds,
+                    }
+                    automl_jobs.start(automl_key, lambda: AutoMLJob(
+                        backend.sample(AUTOML_MAX_ROWS, AUTOML_SEED), automl_target, automl_task_name, automl_models, automl_folds
+                    ))
+                automl_job = automl_jobs.get(automl_key)
+                if automl_job is not None:
+                    polling = not automl_job.done()
+                    st.fragment(render_automl_job, run_every=AUTOML_POLL_SECONDS if polling else None)(automl_job, polling)
 
         with tabs[4]:
-            try:
-                st.markdown("""
-                <div class="card">
-                    <h2 style="color: #8c564b; margin-bottom: 1rem;">📤 Export & Share</h2>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown("---")
-                towrite = BytesIO()
-                df.to_csv(towrite, index=False)
-                towrite.seek(0)
-                b64 = base64.b64encode(towrite.read()).decode()
-                href = f'<a href="data:file/csv;base64,{b64}" download="cleaned_data.csv" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 12px 24px; text-decoration: none; border-radius: 10px; display: inline-block; margin: 10px 0; transition: all 0.3s ease; box-shadow: 0 4px 15px rgba(102, 126, 234, 0.3);">📥 Download Cleaned CSV</a>'
-                st.markdown(href, unsafe_allow_html=True)
-
-                st.markdown("**Email Report**")
-                email_to = st.text_input("Recipient Email")
-                email_subject = st.text_input("Email Subject", "CSV Analysis Report")
-                email_content = summary
-
-                if st.button("Send Email"):
+            if tabs[4].open:
+                try:
                     st.markdown("""
-                    <div class="warning-message">
-                        ⚠️ Email functionality requires proper SMTP configuration. Please update the email settings in the code.
+                    <div class="card">
+                        <h2 style="color: #8c564b; margin-bottom: 1rem;">📤 Export & Share</h2>
                     </div>
                     """, unsafe_allow_html=True)
+                
+                    st.markdown("---")
+                    st.markdown("**Download Cleaned Data**")
+                    export_format = st.selectbox("Export Format", list(EXPORT_FORMATS.keys()))
+                    file_ext, export_mime = EXPORT_FORMATS[export_format][2:]
+                    # Nothing is serialized until the button is clicked; the file is then written once per dataset version
+                    st.download_button(
+                        f"📥 Download Cleaned {export_format}",
+                        lambda: Path(export_file(backend, export_format)).read_bytes(),
+                        file_name=f"cleaned_data{file_ext}",
+                        mime=export_mime,
+                        on_click="ignore",
+                    )
+                    if os.path.exists(export_path(backend, export_format)):
+                        st.caption("Already exported for this version of the data.")
 
-                # --- WhatsApp Share Feature ---
-                st.markdown("---")
-                st.markdown("**Share Insights via WhatsApp**")
-                wa_number = st.text_input("Enter WhatsApp number (with country code, e.g. 919876543210)")
-                wa_message = f"Hi! Here are the insights from my CSV analysis:\n\n{summary}\n\n(You can also find the attached PDF/report.)"
-                encoded_message = urllib.parse.quote(wa_message)
-                if wa_number:
-                    wa_url = f"https://wa.me/{wa_number}?text={encoded_message}"
-                    st.markdown(f'''
-                        <a href="{wa_url}" target="_blank" style="background: #25D366; color: white; padding: 12px 24px; border-radius: 10px; text-decoration: none; display: inline-block; margin-top: 10px;">
-                            📤 Send Insights on WhatsApp
-                        </a>
-                        <div style="color: #888; font-size: 0.9em; margin-top: 5px;">
-                            <b>Note:</b> You can attach the downloaded CSV or PDF in WhatsApp chat after clicking the button.
+                    st.markdown("---")
+                    st.markdown("**PDF Report**")
+                    chart_backend = clustered_backend(backend)
+                    report_charts = [
+                        chart for chart in st.session_state.get("report_charts", [])
+                        if all(col in chart_backend.columns for col in chart[0][1:4] if col)
+                    ]
+                    if report_charts:
+                        st.markdown("\n".join(
+                            f"{i}. {describe_graph(graph)} ({theme_name})" for i, (graph, theme_name) in enumerate(report_charts, start=1)
+                        ))
+                        if st.button("Clear Report Charts"):
+                            st.session_state["report_charts"] = []
+                            st.rerun()
+                    else:
+                        st.markdown("""
+                        <div class="info-message">
+                            ℹ️ The report covers the column profile, missing values and insights. Use "Add to Report" in Visualizations to include charts.
                         </div>
-                    ''', unsafe_allow_html=True)
-            except Exception as e:
-                st.markdown(f"""
-                <div class="warning-message">
-                    ❌ Error in Export & WhatsApp section: {e}
-                </div>
-                """, unsafe_allow_html=True)
+                        """, unsafe_allow_html=True)
+                    # Same data and the same charts give the same report
+                    report_key = (chart_backend.version, tuple(report_charts))
+                    report_job = st.session_state.get("report_job")
+                    if st.button("Generate PDF Report"):
+                        if report_job is not None:
+                            report_job.future.cancel()
+                        report_job = ReportJob(report_key, build_report, chart_backend, stages, summary, categorical_cols, report_charts)
+                        st.session_state["report_job"] = report_job
+                    if report_job is not None:
+                        if report_job.key != report_key:
+                            st.caption("The data or charts changed since this report was generated; generate it again to update it.")
+                        polling = not report_job.done()
+                        st.fragment(render_report_job, run_every=REPORT_POLL_SECONDS if polling else None)(report_job, polling)
+
+                    st.markdown("---")
+                    st.markdown("**Email Report**")
+                    email_to = st.text_input("Recipient Email")
+                    email_subject = st.text_input("Email Subject", "CSV Analysis Report")
+                    email_content = summary
+                    attach_data = st.checkbox(f"Attach cleaned data ({export_format})")
+                    report_ready = (
+                        report_job is not None and report_job.key == report_key
+                        and report_job.done() and report_job.future.exception() is None
+                    )
+                    attach_report = st.checkbox(
+                        "Attach PDF report", disabled=not report_ready,
+                        help=None if report_ready else "Generate the PDF report for the current data first."
+                    )
+
+                    if st.button("Send Email"):
+                        if not SMTP_HOST:
+                            st.markdown("""
+                            <div class="warning-message">
+                                ⚠️ Email needs an SMTP server. Set CSV_BOT_SMTP_HOST (and CSV_BOT_SMTP_USER / CSV_BOT_SMTP_PASSWORD if it requires login).
+                            </div>
+                            """, unsafe_allow_html=True)
+                        elif "@" not in email_to:
+                            st.markdown("""
+                            <div class="warning-message">
+                                ⚠️ Please enter a valid recipient email
+                            </div>
+                            """, unsafe_allow_html=True)
+                        else:
+                            # Attachments are passed as paths and only read by the mail worker at send time
+                            attachments = []
+                            if attach_data:
+                                attachments.append((f"cleaned_data{file_ext}", export_mime, lambda: export_file(backend, export_format)))
+                            if attach_report:
+                                attachments.append(("csv_report.pdf", "application/pdf", report_job.result))
+                            mail_job = MailJob(email_to, email_subject, email_content, attachments)
+                            st.session_state.setdefault("mail_jobs", []).append(get_mail_queue().submit(mail_job))
+                    mail_jobs = st.session_state.get("mail_jobs", [])
+                    if mail_jobs:
+                        polling = not all(job.done for job in mail_jobs)
+                        st.fragment(render_mail_jobs, run_every=MAIL_POLL_SECONDS if polling else None)(mail_jobs, polling)
+
+                    # --- WhatsApp Share Feature ---
+                    st.markdown("---")
+                    st.markdown("**Share Insights via WhatsApp**")
+                    wa_number = st.text_input("Enter WhatsApp number (with country code, e.g. 919876543210)")
+                    wa_message = f"Hi! Here are the insights from my CSV analysis:\n\n{summary}\n\n(You can also find the attached PDF/report.)"
+                    encoded_message = urllib.parse.quote(wa_message)
+                    if wa_number:
+                        wa_url = f"https://wa.me/{wa_number}?text={encoded_message}"
+                        st.markdown(f'''
+                            <a href="{wa_url}" target="_blank" style="background: #25D366; color: white; padding: 12px 24px; border-radius: 10px; text-decoration: none; display: inline-block; margin-top: 10px;">
+                                📤 Send Insights on WhatsApp
+                            </a>
+                            <div style="color: #888; font-size: 0.9em; margin-top: 5px;">
+                                <b>Note:</b> You can attach the downloaded CSV or PDF in WhatsApp chat after clicking the button.
+                            </div>
+                        ''', unsafe_allow_html=True)
+                except Exception as e:
+                    st.markdown(f"""
+                    <div class="warning-message">
+                        ❌ Error in Export & WhatsApp section: {e}
+                    </div>
+                    """, unsafe_allow_html=True)
+
     except Exception as e:
         st.markdown(f"""
         <div class="warning-message">
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# bot.py is the Streamlit script; importing it outside `streamlit run` executes the page in bare mode
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,77 @@
+"""A local SMTP server for the mail tests and benchmark: it records messages and can answer DATA with scripted failures."""
+import email
+import socket
+import socketserver
+import threading
+
+
+class SMTPStandIn:
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        # Replies for upcoming DATA commands, e.g. ["451 try again later"]; "250 queued" once empty
+        self.data_replies = []
+        self.lock = threading.Lock()
+        self._sockets = []
+        standin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                standin._handle(self)
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def stop(self):
+        self.drop_connections()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def drop_connections(self):
+        """Close every open connection, as a server restart would."""
+        with self.lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _handle(self, handler):
+        def send(line):
+            handler.wfile.write(f"{line}\r\n".encode())
+
+        with self.lock:
+            self.connections += 1
+            self._sockets.append(handler.connection)
+        send("220 stand-in ready")
+        while True:
+            line = handler.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                send("250-stand-in")
+                send("250 8BITMIME")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                send("250 ok")
+            elif command == "DATA":
+                send("354 end with <CRLF>.<CRLF>")
+                data = []
+                while (chunk := handler.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                with self.lock:
+                    reply = self.data_replies.pop(0) if self.data_replies else None
+                    if reply is None:
+                        self.messages.append(email.message_from_bytes(b"".join(data)))
+                send(reply or "250 queued")
+            elif command == "QUIT":
+                send("221 bye")
+                return
+            else:
+                send("502 not implemented")
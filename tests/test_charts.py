@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "value": rng.integers(0, 5, 1_000).astype("float64"),
+        "city": rng.choice(["Pune", "Delhi", "Mumbai"], 1_000),
+    })
+
+
+@pytest.mark.parametrize("graph_type", ["Bar", "Box", "Histogram", "Density"])
+@pytest.mark.parametrize("x", ["value", "city"])
+def test_aggregated_charts_build_when_x_is_or_is_not_y(frame, graph_type, x):
+    options = {"Bar": (("bar_agg", "sum"),), "Histogram": (("bins", 10),)}.get(graph_type, ())
+    if graph_type == "Density":
+        graph_type, options = "Scatter", (
+            ("point_budget", 5_000), ("full_resolution", False), ("render_choice", "Density"),
+            ("webgl_min_points", 100), ("density_min_points", 500),
+        )
+    backend = bot.PandasBackend(frame, f"charts-{graph_type}-{x}-{options}", [])
+    fig, info = bot.build_figure(backend, backend.version, graph_type, x, "value", None, options)
+    assert len(fig.data) > 0
+
+
+def test_bar_of_a_column_against_itself_sums_each_value(frame):
+    bars = bot.aggregate_bar(frame, "value", "value", None, "sum")
+    expected = frame.groupby("value")["value"].sum()
+    assert bars["value"].tolist() == expected.index.tolist()
+    assert bars[bot.value_column("value", "value")].tolist() == expected.tolist()
+
+
+def test_box_of_a_column_against_itself_has_one_box_per_value(frame):
+    stats, _ = bot.box_summaries(frame, "value", "value", None)
+    assert (stats["median"] == stats["value"]).all()
+
+
+@pytest.mark.parametrize("group_by, expected", [(None, "Density"), ("city", "WebGL")])
+def test_auto_backend_keeps_grouped_scatter_plots_grouped(frame, group_by, expected):
+    backend = bot.PandasBackend(frame.assign(y=np.arange(len(frame))), f"charts-auto-{group_by}", [])
+    options = (
+        ("point_budget", 5_000), ("full_resolution", False), ("render_choice", "Auto"),
+        ("webgl_min_points", 100), ("density_min_points", 500),
+    )
+    fig, info = bot.build_figure(backend, backend.version, "Scatter", "value", "y", group_by, options)
+    assert info["render_backend"] == expected
+    assert len(fig.data) == (1 if group_by is None else 3)
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+@pytest.mark.parametrize("groups", [1, 10, 20_000])
+def test_downsampling_holds_the_point_budget_for_any_number_of_groups(method, groups):
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "x": rng.normal(size=200_000), "y": rng.normal(size=200_000), "g": rng.integers(0, groups, 200_000),
+    })
+    points, source = bot.downsample_for_chart(frame, "x", "y", "g", 5_000, method)
+    assert source == 200_000
+    assert len(points) <= 5_000
+    assert points.index.is_unique
@@ -0,0 +1,32 @@
+import pytest
+
+import bot
+
+COLUMNS = ["a", "b"]
+
+
+@pytest.mark.parametrize("op", [
+    {"op": "dropna"},
+    {"op": "fillna", "strategy": "mean"},
+    {"op": "impute", "strategy": "knn"},
+    {"op": "impute", "columns": [], "strategy": "knn"},
+    {"op": "impute", "columns": "a", "strategy": "knn"},
+    {"op": "dropna", "column": "missing"},
+])
+def test_malformed_steps_are_rejected(op):
+    with pytest.raises(ValueError):
+        bot.validate_ops([op], COLUMNS)
+
+
+def test_steps_from_another_schema_are_rejected():
+    with pytest.raises(ValueError, match="missing 'c'"):
+        bot.validate_ops([{"op": "dropna", "column": "a"}], COLUMNS, ["a", "b", "c"])
+
+
+def test_well_formed_steps_pass():
+    ops = [
+        {"op": "dropna", "column": "a"},
+        {"op": "impute", "columns": ["a", "b"], "strategy": next(iter(bot.IMPUTE_STRATEGIES.values()))},
+        {"op": "drop_duplicates"},
+    ]
+    assert bot.validate_ops(ops, COLUMNS, ["b", "a"]) == ops
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bot
+
+
+@pytest.mark.parametrize("strata", [3, 500, 50_000])
+def test_stratified_sample_never_exceeds_its_size(strata):
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({"group": rng.integers(0, strata, 200_000), "value": rng.normal(size=200_000)})
+    sample = bot.PandasBackend(frame, f"strata-{strata}", []).stratified_sample("group", 10_000, 0)
+    assert len(sample) <= 10_000
+    assert sample.index.is_unique
+
+
+def test_small_strata_get_their_floor_when_it_fits():
+    quotas = bot.stratum_quotas([100_000, 60], 1_000)
+    assert quotas[1] == bot.STRATUM_MIN_ROWS
+    assert sum(quotas) <= 1_000
+
+
+def test_quotas_are_capped_when_floors_do_not_fit():
+    quotas = bot.stratum_quotas([3] * 20_000, 5_000)
+    assert sum(quotas) <= 5_000
+
+
+def test_missing_values_form_their_own_stratum():
+    frame = pd.DataFrame({"group": ["a"] * 900 + [None] * 100, "value": np.arange(1_000.0)})
+    sample = bot.PandasBackend(frame, "strata-missing", []).stratified_sample("group", 200, 0)
+    assert sample["group"].isna().sum() >= bot.STRATUM_MIN_ROWS
+    assert len(sample) <= 200
+
+
+def test_quotas_fill_the_sample_size():
+    sizes = np.random.default_rng(0).integers(1, 200, 20_000)
+    assert sum(bot.stratum_quotas(sizes, 50_000)) == 50_000
+    assert all(0 <= quota <= size for quota, size in zip(bot.stratum_quotas(sizes, 50_000), sizes))
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+import bot
+
+
+def test_month_first_wins_when_both_orders_parse():
+    fmt, twin = bot.sniff_datetime_format(pd.Series(["01/02/2024", "03/04/2024", "12/11/2023"]))
+    assert (fmt, twin) == ("%m/%d/%Y", "%d/%m/%Y")
+
+
+@pytest.mark.parametrize("values, expected", [
+    (["13/02/2024", "25/04/2024", "01/11/2023"], "%d/%m/%Y"),
+    (["02/13/2024", "04/25/2024", "11/01/2023"], "%m/%d/%Y"),
+])
+def test_the_order_that_parses_is_chosen_without_a_note(values, expected):
+    assert bot.sniff_datetime_format(pd.Series(values)) == (expected, None)
+
+
+@pytest.mark.parametrize("values", [["2019", "2020", "2021"], [2019, 2020, 2021], ["1999", "2004", None]])
+def test_year_only_columns_are_not_dates(values):
+    assert bot.sniff_datetime_format(pd.Series(values, dtype=object)) == (None, None)
+
+
+def test_ambiguous_columns_get_a_note():
+    frame = pd.DataFrame({
+        "when": ["01/02/2024", "03/04/2024"], "year": ["2019", "2020"], "day": ["20240131", "20240201"],
+    })
+    parsed, notes = bot.detect_datetime_columns(frame, "test-datetimes")
+    assert list(parsed) == ["when", "day"]
+    assert parsed["when"].iloc[0] == pd.Timestamp("2024-01-02")
+    assert list(notes) == ["when"]
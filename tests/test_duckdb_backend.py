@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def backend(tmp_path):
+    rng = np.random.default_rng(0)
+    path = tmp_path / "points.csv"
+    pd.DataFrame({"x": np.arange(20_000), "y": rng.normal(size=20_000)}).to_csv(path, index=False)
+    return bot.DuckDBBackend(str(path), f"points-{tmp_path.name}", [])
+
+
+def test_full_resolution_charts_are_capped_out_of_core(backend, monkeypatch):
+    monkeypatch.setattr(bot, "DUCKDB_MAX_CHART_POINTS", 1_000)
+    points, source = backend.chart_points("x", "y", None, None, "minmax")
+    assert source == 20_000
+    assert len(points) <= 1_000
+
+
+def test_small_results_are_returned_whole(backend):
+    points, source = backend.chart_points("x", "y", None, None, "minmax")
+    assert len(points) == source == 20_000
+
+
+@pytest.mark.parametrize("page_size", [50, 500])
+def test_preview_pages_hold_exactly_their_rows(backend, page_size):
+    pages = [backend.preview_page(start, page_size) for start in range(0, 3 * page_size, page_size)]
+    assert [len(page) for page in pages] == [page_size] * 3
+    assert pd.concat(pages)["x"].tolist() == list(range(3 * page_size))
+    assert backend.preview_page(19_990, page_size)["x"].tolist() == list(range(19_990, 20_000))
+
+
+def test_preview_pages_straddling_a_block_are_stitched(backend):
+    start = bot.PREVIEW_FETCH_BLOCK_ROWS - 20
+    page = backend.preview_page(start, 50, sort_by="x", ascending=False)
+    assert page["x"].tolist() == list(range(19_999 - start, 19_999 - start - 50, -1))
+
+
+def test_stacked_files_keep_their_own_source_file_column(tmp_path):
+    sources = []
+    for i in range(2):
+        path = tmp_path / f"part{i}.csv"
+        pd.DataFrame({"v": [i, i], "source_file": ["feed", "feed"]}).to_csv(path, index=False)
+        sources.append((str(path), f"part{i}.csv"))
+    backend = bot.DuckDBBackend(sources, f"parts-{tmp_path.name}", [])
+    page = backend.preview_page(0, 10)
+    assert page["source_file"].tolist() == ["feed"] * 4
+    assert sorted(page["source_file_2"]) == ["part0.csv"] * 2 + ["part1.csv"] * 2
+
+
+def test_source_file_column_name_avoids_existing_columns():
+    assert bot.source_file_column(["a"]) == "source_file"
+    assert bot.source_file_column(["source_file", "source_file_2"]) == "source_file_3"
+
+
+def test_stratified_samples_are_reproducible(backend):
+    first = backend.stratified_sample("x", 1_000, seed=3)
+    assert len(first) == 1_000
+    bot.get_shared_store().evict_unpinned()  # drop the cached query so the sample is drawn again
+    pd.testing.assert_frame_equal(first, backend.stratified_sample("x", 1_000, seed=3))
+    assert not first["x"].equals(backend.stratified_sample("x", 1_000, seed=4)["x"])
+
+
+@pytest.mark.parametrize("finest", ["Day", "Week"])
+def test_both_backends_bucket_time_series_alike(tmp_path, finest):
+    frame = pd.DataFrame({
+        "when": pd.date_range("2024-01-03 05:00", periods=24 * 40, freq="h").strftime("%Y-%m-%d %H:%M:%S"),
+        "v": np.arange(24 * 40, dtype="float64"),
+    })
+    path = tmp_path / "times.csv"
+    frame.to_csv(path, index=False)
+    duck = bot.DuckDBBackend(str(path), f"times-{tmp_path.name}", [])
+    pandas = bot.PandasBackend(frame, f"times-{tmp_path.name}", [])
+    expected, expected_freq = pandas.time_series("when", ["v"], "Sum", finest)
+    actual, actual_freq = duck.time_series("when", ["v"], "Sum", finest)
+    assert actual_freq == expected_freq == finest
+    assert actual.index.tolist() == expected.index.tolist()
+    assert actual["v"].tolist() == expected["v"].tolist()
+    if finest == "Week":
+        assert (actual.index.dayofweek == 0).all()
@@ -0,0 +1,26 @@
+import os
+
+import pandas as pd
+
+import bot
+
+
+def test_pruning_tolerates_files_another_session_already_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(bot, "EXPORT_MAX_FILES", 1)
+    for name in ("old-1.csv", "old-2.csv"):
+        (tmp_path / name).write_text("a\n1\n")
+    scandir = os.scandir
+
+    def scandir_then_prune(path):
+        # The listing is taken, then a concurrent export deletes the old files before they are stat'ed
+        entries = list(scandir(path))
+        for entry in entries:
+            if entry.name.startswith("old-"):
+                os.remove(entry.path)
+        return iter(entries)
+
+    monkeypatch.setattr(bot.os, "scandir", scandir_then_prune)
+    backend = bot.PandasBackend(pd.DataFrame({"a": range(10)}), "export-prune", [])
+    path = bot.export_file(backend, next(iter(bot.EXPORT_FORMATS)))
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
@@ -0,0 +1,9 @@
+import pandas as pd
+
+import bot
+
+
+def test_approximate_counts_are_shown_as_a_one_sided_range():
+    lines = bot.insight_lines(pd.Series({"a": 600, "b": 300}), 50, 1_000)
+    assert lines[:2] == ["a: 60.0–65.0%", "b: 30.0–35.0%"]
+    assert "±" not in lines[-1] and "50 rows higher" in lines[-1]
@@ -0,0 +1,36 @@
+import io
+
+import pandas as pd
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(bot, "DTYPE_SAMPLE_ROWS", 4)
+    monkeypatch.setattr(bot, "CSV_CHUNK_ROWS", 4)
+
+
+def read(text):
+    return bot.read_csv_chunked(io.BytesIO(text.encode()))[0]
+
+
+def test_a_numeric_column_that_turns_to_text_is_text_throughout(small_chunks):
+    frame = read("code,n\n" + "".join(f"{i},{i}\n" for i in range(1, 7)) + "A7,7\n,8\n")
+    assert frame["code"].tolist()[:7] == ["1", "2", "3", "4", "5", "6", "A7"]
+    assert pd.isna(frame["code"].iloc[7])
+    assert {type(value) for value in frame["code"].dropna()} == {str}
+    assert pd.api.types.is_integer_dtype(frame["n"])
+
+
+def test_booleans_with_gaps_in_a_later_chunk_stay_boolean(small_chunks):
+    frame = read("flag,n\nTrue,1\nFalse,2\nTrue,3\nTrue,4\nFalse,5\n,6\nTrue,7\n")
+    assert frame["flag"].dtype == "boolean"
+    assert frame["flag"].isna().sum() == 1
+
+
+def test_consistent_chunks_keep_their_types(small_chunks):
+    frame = read("x,label\n" + "".join(f"{i},a\n" for i in range(10)))
+    assert pd.api.types.is_integer_dtype(frame["x"])
+    assert isinstance(frame["label"].dtype, pd.CategoricalDtype)
@@ -0,0 +1,84 @@
+import smtplib
+import socket
+import time
+
+import pytest
+
+import bot
+from smtp_standin import SMTPStandIn
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    server = SMTPStandIn()
+    monkeypatch.setattr(bot, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(bot, "SMTP_PORT", server.port)
+    monkeypatch.setattr(bot, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(bot, "MAIL_BACKOFF_SECONDS", 0.05)
+    yield server
+    server.stop()
+
+
+def wait(job, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.done, job.status
+    return job
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (smtplib.SMTPServerDisconnected("gone"), True),
+    (smtplib.SMTPResponseException(451, b"try later"), True),
+    (smtplib.SMTPResponseException(550, b"no such user"), False),
+    (smtplib.SMTPRecipientsRefused({"a@b.c": (450, b"busy")}), True),
+    (smtplib.SMTPRecipientsRefused({"a@b.c": (550, b"unknown")}), False),
+    (smtplib.SMTPNotSupportedError("no STARTTLS"), False),
+    (ConnectionRefusedError(), True),
+    (socket.timeout(), True),
+    (TypeError("bug"), False),
+    (KeyError("bug"), False),
+])
+def test_only_temporary_failures_are_retried(error, retryable):
+    assert bot.is_retryable(error) is retryable
+
+
+def test_temporary_failures_are_retried_with_backoff(standin):
+    standin.data_replies = ["451 try again later", "451 try again later"]
+    job = wait(bot.MailQueue(workers=1).submit(bot.MailJob("a@b.c", "report", "body")))
+    assert (job.status, job.attempts) == ("Sent", 3)
+    assert standin.messages[-1]["Subject"] == "report"
+
+
+def test_permanent_failures_are_not_retried(standin):
+    standin.data_replies = ["550 mailbox unavailable"]
+    job = wait(bot.MailQueue(workers=1).submit(bot.MailJob("a@b.c", "report", "body")))
+    assert job.status.startswith("Failed") and job.attempts == 1
+
+
+def test_programming_errors_are_not_retried(standin):
+    class Broken(bot.MailQueue):
+        def _send(self, smtp, message):
+            raise TypeError("bug")
+
+    job = wait(Broken(workers=1).submit(bot.MailJob("a@b.c", "report", "body")))
+    assert job.status == "Failed: bug" and job.attempts == 1
+
+
+def test_connection_is_pooled_and_reopened_after_a_drop(standin):
+    mail = bot.MailQueue(workers=1)
+    for i in range(5):
+        wait(mail.submit(bot.MailJob("a@b.c", f"m{i}", "body")))
+    assert standin.connections == 1
+    standin.drop_connections()
+    time.sleep(0.1)
+    job = wait(mail.submit(bot.MailJob("a@b.c", "after drop", "body")))
+    assert (job.status, job.attempts, standin.connections) == ("Sent", 1, 2)
+
+
+def test_login_is_skipped_without_a_password(standin, monkeypatch):
+    # The stand-in doesn't implement AUTH, so a login attempt would fail the job
+    monkeypatch.setattr(bot, "SMTP_USER", "reports@example.com")
+    monkeypatch.setattr(bot, "SMTP_PASSWORD", None)
+    job = wait(bot.MailQueue(workers=1).submit(bot.MailJob("a@b.c", "report", "body")))
+    assert job.status == "Sent"
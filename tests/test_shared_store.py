@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+import bot
+
+MB = 1024**2
+
+
+def block(mb=1):
+    return np.zeros(mb * MB // 8)
+
+
+def make_store(budget_mb=10):
+    store = bot.SharedStore(budget_mb * MB)
+    store.register("ingest", pinnable=True)
+    return store
+
+
+def test_derived_results_of_an_open_dataset_stay_within_the_budget():
+    store = make_store()
+    store.put("ingest", "data", block(2), tag="data")
+    store.pin("data")
+    for i in range(50):
+        store.put("charts", ("chart", i), block(), tag=f"data-{i}")
+    assert store.used_bytes() <= 10 * MB
+    # The pinned base frame survives; the oldest derived results went first
+    assert ("ingest", "data") in store.entries
+    assert ("charts", ("chart", 49)) in store.entries
+    assert ("charts", ("chart", 0)) not in store.entries
+
+
+def test_unpinned_base_frames_are_evicted_least_recently_used_first():
+    store = make_store()
+    for name in ["a", "b", "c"]:
+        store.put("ingest", name, block(3), tag=name)
+    store.lookup("ingest", "a")
+    store.put("ingest", "d", block(3), tag="d")
+    assert [key for _, key in store.entries] == ["c", "a", "d"]
+
+
+def test_namespace_entry_limits_apply():
+    store = make_store(budget_mb=1024)
+    store.register("sorts", max_entries=3)
+    for i in range(10):
+        store.put("sorts", i, block(), tag="data")
+    assert [key for _, key in store.entries] == [7, 8, 9]
+
+
+def test_shared_result_computes_once_and_keys_on_public_arguments():
+    calls = []
+
+    @bot.shared_result("test-results", max_entries=2)
+    def mean(_frame, dataset_version, column):
+        calls.append(column)
+        return _frame[column].mean()
+
+    frame = pd.DataFrame({"a": [1.0, 2.0], "b": [3.0, 5.0]})
+    assert mean(frame, "v1", "a") == mean(frame.copy(), "v1", "a") == 1.5
+    assert mean(frame, "v1", "b") == 4.0
+    assert calls == ["a", "b"]
+
+
+def test_session_lease_unpins_when_collected():
+    store = make_store()
+    lease = bot.StoreLease(store, "data")
+    assert store.pins["data"] == 1
+    del lease
+    assert store.pins["data"] == 0
+
+
+def test_release_hook_runs_when_the_last_session_lets_go():
+    store = make_store()
+    released = []
+    first, second = bot.StoreLease(store, "duckdb-data"), bot.StoreLease(store, "duckdb-data")
+    first.on_release(lambda: released.append("duckdb-data"))
+    first.release()
+    assert released == []
+    second.release()
+    assert released == ["duckdb-data"]
@@ -0,0 +1,98 @@
+"""Jobs that run in worker processes.
+
+bot.py is a Streamlit script and can't be imported by a worker process, so anything
+a process pool has to pickle by reference lives here.
+"""
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# pycaret model id -> display name, limited to the estimators that ship with scikit-learn
+AUTOML_MODELS = {
+    "classification": {
+        "lr": "Logistic Regression", "ridge": "Ridge Classifier", "nb": "Naive Bayes",
+        "knn": "K Neighbors", "dt": "Decision Tree", "rf": "Random Forest",
+        "et": "Extra Trees", "ada": "AdaBoost", "gbc": "Gradient Boosting",
+    },
+    "regression": {
+        "lr": "Linear Regression", "ridge": "Ridge Regression", "lasso": "Lasso Regression",
+        "knn": "K Neighbors", "dt": "Decision Tree", "rf": "Random Forest",
+        "et": "Extra Trees", "ada": "AdaBoost", "gbr": "Gradient Boosting",
+    },
+}
+# Leaderboard order: higher is better for both
+AUTOML_SORT_METRIC = {"classification": "Accuracy", "regression": "R2"}
+
+
+def parse_file(path, sniffed):
+    """Parse one uploaded file into an Arrow table; returns (table, parser, seconds)."""
+    started = time.perf_counter()
+    if sniffed["format"] == "parquet":
+        return pq.read_table(path), "parquet", time.perf_counter() - started
+    read_kwargs = dict(sep=sniffed["sep"], encoding=sniffed["encoding"], compression=sniffed["compression"])
+    try:
+        # Arrow-backed columns convert to a table without a copy
+        frame, parser = pd.read_csv(path, engine="pyarrow", dtype_backend="pyarrow", **read_kwargs), "pyarrow"
+    except Exception:
+        frame, parser = pd.read_csv(path, **read_kwargs), "c"
+    return pa.Table.from_pandas(frame, preserve_index=False), parser, time.perf_counter() - started
+
+
+def feature_importance(model, columns):
+    """Impurity importances for tree ensembles, absolute coefficients for linear models."""
+    if hasattr(model, "feature_importances_"):
+        values = model.feature_importances_
+    elif hasattr(model, "coef_"):
+        coef = abs(model.coef_)
+        values = coef.mean(axis=0) if coef.ndim > 1 else coef
+    else:
+        return None
+    return pd.Series(values, index=columns).sort_values(ascending=False)
+
+
+def run_automl(frame, target, task, models, folds, seed, progress):
+    """Cross-validate each model on `frame` and return the leaderboard and the best model's feature importance.
+
+    Progress goes to the `progress` queue as ("status", text) and ("model", row) events.
+    """
+    # pycaret's import probes every soft dependency; only the worker process pays for it, and only once
+    progress.put(("status", "Loading pycaret..."))
+    if task == "classification":
+        from pycaret.classification import ClassificationExperiment as Experiment
+    else:
+        from pycaret.regression import RegressionExperiment as Experiment
+
+    progress.put(("status", "Preparing data..."))
+    experiment = Experiment()
+    experiment.setup(
+        frame.dropna(subset=[target]), target=target, session_id=seed, fold=folds,
+        verbose=False, html=False, system_log=False, n_jobs=1,
+    )
+    fitted, rows = {}, []
+    for i, model_id in enumerate(models, start=1):
+        name = AUTOML_MODELS[task][model_id]
+        progress.put(("status", f"Training {name} ({i} of {len(models)})..."))
+        started = time.perf_counter()
+        try:
+            fitted[model_id] = experiment.create_model(model_id, verbose=False)
+        except Exception as e:
+            progress.put(("status", f"{name} failed: {e}"))
+            continue
+        row = {"Model": name, **experiment.pull().loc["Mean"].to_dict(), "Seconds": round(time.perf_counter() - started, 2)}
+        rows.append((model_id, row))
+        progress.put(("model", row))
+    if not rows:
+        raise RuntimeError("no model could be trained on this target")
+
+    metric = AUTOML_SORT_METRIC[task]
+    rows.sort(key=lambda item: item[1][metric], reverse=True)
+    best_id = rows[0][0]
+    leaderboard = pd.DataFrame([row for _, row in rows]).set_index("Model")
+    columns = experiment.get_config("X_train_transformed").columns
+    return {
+        "leaderboard": leaderboard,
+        "best": AUTOML_MODELS[task][best_id],
+        "importance": feature_importance(fitted[best_id], columns),
+    }